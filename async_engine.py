@@ -0,0 +1,233 @@
+"""
+asyncio scraping engine, selected with OFACPenaltyScraper(engine='async').
+
+Every year's listing page is fetched at once, then all of the new PDFs are
+downloaded concurrently on one httpx client and their text is extracted on
+a process pool. Each year's changes are committed in one transaction as soon
+as its last PDF is stored, so a backfill takes roughly as long as its slowest
+downloads.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import httpx
+
+from pdf_extraction import (
+    combine_extractions, extract_pdf_file, limit_extraction_memory, may_split, page_ranges, pdf_page_count
+)
+from scraper import PDF_CHUNK_SIZE, PdfSpool, remove_file
+
+async def http_get(client: httpx.AsyncClient, scraper, url: str, headers: dict = None,
+                   stream: bool = False) -> httpx.Response:
+    """
+    The async counterpart of OFACPenaltyScraper.http_get, sharing its rate limit and retry
+    settings. A `stream` response's body is left unread, and the caller must close it.
+    """
+    for attempt in range(scraper.max_retries + 1):
+        await asyncio.sleep(scraper.rate_limiter.reserve())
+        scraper.metrics.add('http_requests')
+        try:
+            response = await client.send(client.build_request("GET", url, headers=headers), stream=stream)
+        except httpx.TransportError as e:
+            if attempt == scraper.max_retries:
+                raise
+            delay = scraper.retry_delay(attempt)
+            print(f"Error fetching {url}: {e}. Retrying in {delay:.1f}s")
+        else:
+            if (response.status_code != 429 and response.status_code < 500) or attempt == scraper.max_retries:
+                return response
+            delay = scraper.retry_delay(attempt, response.headers.get('Retry-After'))
+            print(f"{url} returned {response.status_code}. Retrying in {delay:.1f}s")
+            await response.aclose()
+        scraper.metrics.add('http_retries')
+        await asyncio.sleep(delay)
+
+async def fetch_listing_page(client: httpx.AsyncClient, scraper, url: str, force: bool = False, year: int = None):
+    """Conditionally fetch a listing page, like OFACPenaltyScraper.fetch_listing_page."""
+    with scraper.metrics.timer('listing_fetch', year):
+        stored = None if force else scraper.get_listing_validators(url)
+        response = await http_get(client, scraper, url, scraper.conditional_headers(stored))
+        validators = scraper.listing_response_validators(response, stored)
+    return (response, validators) if validators else None
+
+async def download_pdf(client: httpx.AsyncClient, scraper, pdf_url: str, source=None, year: int = None):
+    """Download a PDF, like OFACPenaltyScraper.download_pdf."""
+    try:
+        with scraper.metrics.timer('pdf_download', year):
+            response = await http_get(client, scraper, pdf_url, scraper.conditional_headers(source), stream=True)
+            try:
+                result = scraper.pdf_response_result(response, source)
+                if result is None:
+                    spool = PdfSpool(scraper.max_pdf_size, scraper.spool_dir, response.headers.get('Content-Length'))
+                    try:
+                        async for chunk in response.aiter_bytes(PDF_CHUNK_SIZE):
+                            spool.write(chunk)
+                    except BaseException:
+                        spool.discard()
+                        raise
+                    result = spool.close(), scraper.pdf_source(response, spool), None
+            finally:
+                await response.aclose()
+    except Exception as e:
+        print(f"Error downloading PDF {pdf_url}: {e}")
+        result = None, None, str(e)
+    scraper.record_download(result, year)
+    return result
+
+async def extract_pdf(scraper, extract_pool, pdf_path):
+    """
+    Extract a spooled PDF on the pool (the default thread pool without one), splitting
+    a long PDF into page ranges extracted concurrently, like pdf_extraction.extract_in_pool.
+    """
+    loop = asyncio.get_running_loop()
+    timeout, backends = scraper.extract_timeout, scraper.extract_backends
+    if extract_pool and may_split(pdf_path, scraper.split_pages, scraper.extract_workers):
+        page_count, seconds, error = await loop.run_in_executor(extract_pool, pdf_page_count, pdf_path, backends, timeout)
+        if page_count is None:
+            return None, seconds, error
+        ranges = page_ranges(page_count, scraper.extract_workers, scraper.split_pages)
+        if ranges:
+            return combine_extractions(await asyncio.gather(*(
+                loop.run_in_executor(extract_pool, extract_pdf_file, pdf_path, timeout, backends, pages)
+                for pages in ranges
+            )))
+    return await loop.run_in_executor(extract_pool, extract_pdf_file, pdf_path, timeout, backends)
+
+class AsyncPdfStore:
+    """
+    Downloads, extracts and stores the PDFs of new penalties. At most fetch_workers
+    downloads run at once, and at most four times as many PDFs are held in memory.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, scraper, extract_pool):
+        self.client = client
+        self.scraper = scraper
+        self.extract_pool = extract_pool
+        self.downloads = asyncio.Semaphore(scraper.fetch_workers)
+        self.in_flight = asyncio.Semaphore(scraper.fetch_workers * 4)
+        # PDFs whose bytes hash to one of these skip extraction
+        self.cached_hashes = scraper.get_cached_pdf_hashes()
+
+    def submit_year(self, tasks: asyncio.TaskGroup, year, pdf_penalties, updated, removed_ids):
+        """Queue a year's changes, like PdfPipeline.submit_year."""
+        batch = {
+            'year': year,
+            'inserts': [],
+            'updates': updated,
+            'removed_ids': removed_ids,
+            'pending': len(pdf_penalties),
+            'total': len(pdf_penalties)
+        }
+        if not pdf_penalties:
+            self.apply(batch)
+        for pdf_url, penalties in pdf_penalties.items():
+            tasks.create_task(self.store(batch, pdf_url, penalties))
+        return batch
+
+    def submit_retries(self, tasks: asyncio.TaskGroup, pdf_urls: list):
+        """Queue previously failed PDFs, like PdfPipeline.submit_retries."""
+        if pdf_urls:
+            self.submit_year(tasks, None, {pdf_url: [] for pdf_url in pdf_urls}, [], [])
+
+    async def store(self, batch, pdf_url: str, penalties: list):
+        async with self.in_flight:
+            source = self.scraper.get_pdf_source(pdf_url)
+            async with self.downloads:
+                pdf_path, source, error = await download_pdf(self.client, self.scraper, pdf_url, source, batch['year'])
+
+            pdf_text = None
+            try:
+                if pdf_path is not None and not self.scraper.text_cached(source, self.cached_hashes, batch['year']):
+                    result = await extract_pdf(self.scraper, self.extract_pool, pdf_path)
+                    pdf_text, error = self.scraper.record_extraction(result, batch['year'])
+            except Exception as e:
+                # The worker died, e.g. killed by the system
+                print(f"Error extracting PDF text: {e}")
+                error = f"Error extracting PDF text: {e}"
+            finally:
+                remove_file(pdf_path)
+
+            self.scraper.store_pdf_result(batch, pdf_url, pdf_text, penalties, source, error)
+
+    def apply(self, batch):
+        """Apply a batch without PDFs to wait for."""
+        self.scraper.apply_batch(batch)
+
+async def scrape_and_store_async(scraper, start_year: int, end_year: int, force: bool = False):
+    """The async engine behind OFACPenaltyScraper.scrape_and_store."""
+    current_year = datetime.now().year
+    years = scraper.years_to_scrape(start_year, end_year)
+
+    extract_pool = ProcessPoolExecutor(
+        max_workers=scraper.extract_workers, initializer=limit_extraction_memory,
+        initargs=(scraper.extract_memory_mb,),
+        mp_context=multiprocessing.get_context(scraper.extract_start_method)
+    ) if scraper.extract_workers else None
+    if extract_pool:
+        # Start the worker processes before the event loop's threads exist
+        extract_pool.submit(int).result()
+
+    limits = httpx.Limits(max_connections=scraper.pool_size, max_keepalive_connections=scraper.pool_size)
+    connect_timeout, read_timeout = scraper.timeout
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    try:
+        async with httpx.AsyncClient(
+            headers=scraper.headers, limits=limits, timeout=timeout, follow_redirects=True
+        ) as client:
+            store = AsyncPdfStore(client, scraper, extract_pool)
+
+            # Fetch every year's listing page at once
+            urls = [scraper.listing_url(year, current_year) for year in years]
+            listings = await asyncio.gather(
+                *(fetch_listing_page(client, scraper, url, force, year) for year, url in zip(years, urls)),
+                return_exceptions=True
+            )
+
+            checked_listings = []
+            async with asyncio.TaskGroup() as tasks:
+                # PDFs that failed in earlier runs; their listing pages may be unchanged
+                store.submit_retries(tasks, scraper.get_failed_pdfs(years if scraper.checkpoint else None))
+
+                for year, url, listing in zip(years, urls, listings):
+                    if isinstance(listing, Exception):
+                        print(f"Error processing year {year}: {listing}")
+                        continue
+                    if listing is None:
+                        scraper.metrics.add('listings_unchanged', year=year)
+                        print(f"Year {year}: Listing page unchanged. Skipping...")
+                        scraper.record_year_checked(year)
+                        continue
+                    response, validators = listing
+                    scraper.metrics.add('listing_bytes', len(response.content), year)
+
+                    with scraper.metrics.timer('listing_parse', year):
+                        web_entries = scraper.parse_listing(response.text)
+                    if web_entries is None:
+                        print(f"No table found for year {year}")
+                        continue
+
+                    with scraper.metrics.timer('diff', year):
+                        changes = scraper.diff_year(year, web_entries)
+                    scraper.record_year_checked(year, changes)
+                    if changes is None:
+                        checked_listings.append((url, validators, None))
+                        continue
+
+                    checked_listings.append((url, validators, store.submit_year(tasks, year, *changes)))
+
+            # Only remember the listing pages once all of their PDFs are stored, and not
+            # those whose changes failed to commit, so the next run tries them again
+            for url, validators, batch in checked_listings:
+                if batch is None or batch.get('committed'):
+                    scraper.save_listing_validators(url, validators)
+
+    except Exception as e:
+        print(f"Error in scraping process: {e}")
+        raise e
+    finally:
+        if extract_pool:
+            extract_pool.shutdown(wait=True)
+        scraper.close_db_connection()
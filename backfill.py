@@ -0,0 +1,136 @@
+"""
+Checkpoints for backfills, so an interrupted one resumes where it stopped.
+
+A backfill is a named job over a range of years, scraped with
+OFACPenaltyScraper.scrape_and_store(..., checkpoint=Backfill(job)). Each year goes
+from pending to fetched (listing read, new PDFs queued) to stored (committed with
+its penalties), and each of its new PDFs from pending to fetched (downloaded),
+extracted (text read) and stored, in the backfill_years and backfill_pdfs tables.
+A rerun of the job skips the stored years; PDFs extracted before it stopped come
+back from the text cache instead of being extracted again. Once all of its years
+are stored the job is closed and its rows deleted, so running it again starts a
+new backfill.
+
+A process claims the years it scrapes, so separate processes can backfill disjoint
+year ranges of the same database (see repair_db.re_scrape_all_data):
+
+    python repair_db.py --start-year 2003 --end-year 2013 &
+    python repair_db.py --start-year 2014 &
+"""
+import os
+import socket
+from datetime import datetime, timedelta
+
+# A claim on a year older than this is assumed to belong to a process that died
+STALE_AFTER = timedelta(hours=6)
+
+def process_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def owner_alive(owner: str) -> bool:
+    """Whether the process that claimed a year may still be running. Only processes on this host can be checked."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit() or os.name == 'nt':
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Backfill:
+    """
+    The checkpoint of one backfill job, held by one process. Its methods write with the
+    caller's cursor, so they commit (or roll back) with the caller's transaction.
+    """
+
+    def __init__(self, job: str = 'backfill', owner: str = None):
+        self.job = job
+        self.owner = owner or process_owner()
+
+    def claim_year(self, cursor, year: int) -> bool:
+        """
+        Claim a year that isn't stored yet, unless a live process already claimed it.
+        The insert starts a write transaction, so two processes can't both claim a year.
+        """
+        now = datetime.now()
+        cursor.execute("""
+            INSERT OR IGNORE INTO backfill_years (job, year, state, updated_at)
+            VALUES (?, ?, 'pending', ?)
+        """, (self.job, year, now.isoformat(timespec='seconds')))
+        cursor.execute("SELECT state, owner, claimed_at FROM backfill_years WHERE job = ? AND year = ?",
+                       (self.job, year))
+        state, owner, claimed_at = cursor.fetchone()
+        if state == 'stored':
+            return False
+        if (owner and owner != self.owner and owner_alive(owner)
+                and datetime.fromisoformat(claimed_at) > now - STALE_AFTER):
+            return False
+        cursor.execute("""
+            UPDATE backfill_years SET owner = ?, claimed_at = ?
+            WHERE job = ? AND year = ? AND owner IS ?
+        """, (self.owner, now.isoformat(timespec='seconds'), self.job, year, owner))
+        return cursor.rowcount == 1
+
+    def year_fetched(self, cursor, year: int, pdf_urls: list):
+        """A year's listing was read and its new PDFs are about to be downloaded."""
+        now = datetime.now().isoformat(timespec='seconds')
+        cursor.execute("UPDATE backfill_years SET state = 'fetched', updated_at = ? WHERE job = ? AND year = ?",
+                       (now, self.job, year))
+        cursor.executemany("""
+            INSERT INTO backfill_pdfs (job, pdf_url, year, state, updated_at)
+            VALUES (?, ?, ?, 'pending', ?)
+            ON CONFLICT (job, pdf_url) DO UPDATE SET year = excluded.year, updated_at = excluded.updated_at
+        """, [(self.job, pdf_url, year, now) for pdf_url in pdf_urls])
+
+    def pdf_progress(self, cursor, pdf_url: str, state: str, error: str = None):
+        """A PDF was downloaded ('fetched') or its text read ('extracted'), or it failed ('pending')."""
+        cursor.execute("""
+            UPDATE backfill_pdfs SET state = ?, error = ?, updated_at = ?
+            WHERE job = ? AND pdf_url = ? AND state != 'stored'
+        """, (state, error, datetime.now().isoformat(timespec='seconds'), self.job, pdf_url))
+
+    def pdfs_stored(self, cursor, pdf_urls: list):
+        """The pages of these PDFs are being stored in the caller's transaction."""
+        cursor.executemany("""
+            UPDATE backfill_pdfs SET state = 'stored', error = NULL, updated_at = ?
+            WHERE job = ? AND pdf_url = ?
+        """, [(datetime.now().isoformat(timespec='seconds'), self.job, pdf_url) for pdf_url in pdf_urls])
+
+    def year_stored(self, cursor, year: int):
+        """A year's changes are being committed in the caller's transaction."""
+        cursor.execute("""
+            UPDATE backfill_years SET state = 'stored', owner = NULL, updated_at = ?
+            WHERE job = ? AND year = ?
+        """, (datetime.now().isoformat(timespec='seconds'), self.job, year))
+
+    def release(self, cursor):
+        """Give up this process's claims on the years it didn't finish, so another run can take them."""
+        cursor.execute("UPDATE backfill_years SET owner = NULL WHERE job = ? AND owner = ?", (self.job, self.owner))
+
+    def close(self, cursor) -> bool:
+        """Delete the job's progress if every one of its years is stored. Returns whether it was closed."""
+        cursor.execute("""
+            DELETE FROM backfill_years WHERE job = ?
+            AND NOT EXISTS (SELECT 1 FROM backfill_years WHERE job = ? AND state != 'stored')
+        """, (self.job, self.job))
+        if not cursor.rowcount:
+            return False
+        cursor.execute("DELETE FROM backfill_pdfs WHERE job = ?", (self.job,))
+        return True
+
+def reset(cursor, job: str, start_year: int, end_year: int):
+    """Forget a job's progress over a range of years, so they are scraped again."""
+    cursor.execute("DELETE FROM backfill_pdfs WHERE job = ? AND year BETWEEN ? AND ?", (job, start_year, end_year))
+    cursor.execute("DELETE FROM backfill_years WHERE job = ? AND year BETWEEN ? AND ?", (job, start_year, end_year))
+
+def progress(cursor, job: str) -> dict:
+    """Number of a job's years and PDFs in each state, and the years not stored yet."""
+    cursor.execute("SELECT state, COUNT(*) FROM backfill_years WHERE job = ? GROUP BY state", (job,))
+    years = dict(cursor.fetchall())
+    cursor.execute("SELECT state, COUNT(*) FROM backfill_pdfs WHERE job = ? GROUP BY state", (job,))
+    pdfs = dict(cursor.fetchall())
+    cursor.execute("SELECT year FROM backfill_years WHERE job = ? AND state != 'stored' ORDER BY year", (job,))
+    return {'years': years, 'pdfs': pdfs, 'unfinished_years': [row[0] for row in cursor.fetchall()]}
@@ -0,0 +1,532 @@
+"""
+Benchmarks for imports, scraping, PDF extraction, search and excerpts, run offline.
+
+Scraping and extraction replay a fixture corpus of listing pages and PDFs served by
+a local HTTP stand-in for ofac.treasury.gov. The corpus is either generated, or
+recorded once from the real site with --record. Search and excerpts run against a
+synthetic database of `--scale` times the 1,046 penalties the site lists today.
+
+Extraction is timed with every installed PDF backend, and on one long PDF extracted
+whole and split into page ranges. The imports stage times a cold import of the web
+page and the scraper, as a new container pays it on its first page load.
+
+Results are printed (or written with --output) as JSON, with throughput and
+p50/p95 latencies per stage, so runs can be compared across commits:
+
+    python benchmark.py --scale 10 --output bench.json
+"""
+import argparse
+import contextlib
+import functools
+import http.server
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from urllib.parse import urlsplit
+
+import database
+import listing_parser
+import pdf_extraction
+from scraper import OFACPenaltyScraper
+
+# Penalties listed on the OFAC site when this benchmark was written
+BASELINE_PENALTIES = 1046
+FIRST_YEAR = 2003
+LISTING_PATH = "civil-penalties-and-enforcement-information"
+
+# Words for synthetic documents; drawn with Zipf-like weights so the full-text index
+# sees a realistic mix of very common and rare terms
+DOMAIN_WORDS = (
+    "the of and to in a OFAC sanctions apparent violations penalty settlement company bank "
+    "transactions export goods services Iran Cuba Syria Sudan Russia Venezuela North Korea "
+    "license regulations payment transfer wire funds blocked property interests entity "
+    "designated person compliance program voluntary disclosure egregious aggravating "
+    "mitigating factors statutory maximum base civil monetary treasury department subsidiary "
+    "customers shipments letters credit vessel cargo insurance reinsurance software "
+    "technology distributor agreement investigation remedial measures management"
+).split()
+VOCABULARY = DOMAIN_WORDS + [f"term{i}" for i in range(5000)]
+WEIGHTS = [1.0 / rank for rank in range(1, len(VOCABULARY) + 1)]
+NAME_PARTS = (
+    "Atlantic Pacific Global United National First Meridian Northern Summit Apex Harbor "
+    "Pioneer Liberty Crescent Sterling Evergreen Frontier Keystone Horizon Cobalt"
+).split()
+# Stand-ins for the scripts, styles and menus around the table on the real listing pages
+PAGE_HEAD = "".join(f'<link rel="stylesheet" href="/themes/style{i}.css"><script src="/js/app{i}.js"></script>'
+                    for i in range(40)) + "<script>" + "var menu = {};" * 2000 + "</script>"
+PAGE_NAVIGATION = "<nav><ul>" + "".join(f'<li class="usa-nav__item"><a href="/page/{i}">Menu item {i}</a></li>'
+                                       for i in range(600)) + "</ul></nav>"
+# Modules timed by the imports stage, and the heavy dependencies reported as loaded by each
+IMPORT_MODULES = ('streamlit', 'webpage', 'scraper')
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'requests', 'bs4', 'lxml', 'PyPDF2', 'httpx', 'scraper')
+NAME_SUFFIXES = ["Bank", "Inc.", "LLC", "Ltd.", "Corporation", "Trading Co.", "Shipping", "Holdings"]
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(samples: list, items: int = None, unit: str = "calls") -> dict:
+    """Throughput and latency percentiles of a stage, from its per-call durations in seconds."""
+    total = sum(samples)
+    items = len(samples) if items is None else items
+    return {
+        'calls': len(samples),
+        'items': items,
+        'unit': unit,
+        'total_s': round(total, 4),
+        'throughput_per_s': round(items / total, 2) if total else None,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3) if samples else None,
+        'p95_ms': round(percentile(samples, 95) * 1000, 3) if samples else None,
+        'max_ms': round(max(samples) * 1000, 3) if samples else None
+    }
+
+def timed(function, *args, **kwargs):
+    """Run a function, returning its result and how long it took."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def synthetic_name(rnd: random.Random, index: int) -> str:
+    return f"{rnd.choice(NAME_PARTS)} {rnd.choice(NAME_PARTS)} {rnd.choice(NAME_SUFFIXES)} {index}"
+
+def synthetic_pages(rnd: random.Random, name: str, words_per_page: int = 350) -> list:
+    """Text of each page of a synthetic enforcement release about `name`."""
+    pages = []
+    for _ in range(rnd.randint(2, 6)):
+        words = rnd.choices(VOCABULARY, WEIGHTS, k=words_per_page)
+        # Mention the entity a few times on each page, as real releases do
+        for _ in range(3):
+            words.insert(rnd.randrange(len(words)), name)
+        pages.append("\n".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12)))
+    return pages
+
+def make_pdf(pages: list) -> bytes:
+    """A minimal PDF with one Helvetica text line per line of each page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] "
+        f"/Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, text in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        lines = []
+        for line_no, line in enumerate(text.split("\n")):
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            lines.append(f"BT /F1 9 Tf 40 {760 - 11 * line_no} Td ({escaped}) Tj ET")
+        stream = "\n".join(lines).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def listing_file(root: str, year: int, current_year: int) -> str:
+    """Where a year's listing page lives in a fixture corpus, mirroring its URL path."""
+    if year == current_year:
+        return os.path.join(root, LISTING_PATH, "index.html")
+    return os.path.join(root, LISTING_PATH, f"{year}-enforcement-information")
+
+def generate_fixtures(root: str, penalties: int, seed: int = 0):
+    """Write a synthetic corpus of yearly listing pages and their PDFs under `root`."""
+    rnd = random.Random(seed)
+    current_year = datetime.now().year
+    years = list(range(FIRST_YEAR, current_year + 1))
+    os.makedirs(os.path.join(root, LISTING_PATH), exist_ok=True)
+    os.makedirs(os.path.join(root, "media"), exist_ok=True)
+
+    for year_index, year in enumerate(years):
+        count = penalties // len(years) + (1 if year_index < penalties % len(years) else 0)
+        rows = []
+        for i in range(count):
+            name = synthetic_name(rnd, year * 10000 + i)
+            pdf_path = f"/media/{year}{i:05d}.pdf"
+            with open(os.path.join(root, pdf_path.lstrip("/")), "wb") as f:
+                f.write(make_pdf(synthetic_pages(rnd, name)))
+            rows.append(
+                f'<tr><td><a href="{pdf_path}">{i % 12 + 1:02d}/{i % 28 + 1:02d}/{year}</a></td>'
+                f'<td>{name}</td><td>{rnd.randint(1, 40)}</td><td>${rnd.randint(1000, 10 ** 8):,}</td></tr>'
+            )
+        html = (
+            f'<html><head>{PAGE_HEAD}</head><body>{PAGE_NAVIGATION}<main><table class="usa-table"><tr>'
+            f'<th>Date</th><th>Name</th><th>Number</th><th>Amount</th></tr>{"".join(rows)}'
+            f'<tr><td>Totals</td><td></td><td></td><td></td></tr></table></main>{PAGE_NAVIGATION}</body></html>'
+        )
+        with open(listing_file(root, year, current_year), "w") as f:
+            f.write(html)
+
+    with open(os.path.join(root, "corpus.json"), "w") as f:
+        json.dump({'penalties': penalties, 'seed': seed, 'synthetic': True}, f)
+
+def record_fixtures(root: str):
+    """Download the real listing pages and PDFs into `root`, once, for offline replay."""
+    scraper = OFACPenaltyScraper(db_path=os.path.join(root, "record.db"))
+    current_year = datetime.now().year
+    penalties = 0
+    for year in range(FIRST_YEAR, current_year + 1):
+        response = scraper.http_get(scraper.listing_url(year, current_year), headers=scraper.headers)
+        response.raise_for_status()
+        path = listing_file(root, year, current_year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        html = response.text.replace(scraper.penalties_url, "")
+        with open(path, "w") as f:
+            f.write(html)
+
+        for entry in (scraper.parse_listing(response.text) or {}).values():
+            # Real PDF links end in "/download?inline"; the fixture server ignores the query
+            local_path = os.path.join(root, urlsplit(entry['pdf_url']).path.lstrip("/"))
+            penalties += 1
+            if os.path.exists(local_path):
+                continue
+            spooled_path, _, _ = scraper.download_pdf(entry['pdf_url'])
+            if spooled_path:
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                shutil.move(spooled_path, local_path)
+        print(f"Recorded {year}")
+
+    with open(os.path.join(root, "corpus.json"), "w") as f:
+        json.dump({'penalties': penalties, 'synthetic': False}, f)
+
+def serve_fixtures(root: str) -> http.server.ThreadingHTTPServer:
+    """Serve a fixture corpus on a free local port, with Last-Modified revalidation."""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=root))
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server
+
+def fixture_scraper(server, db_path: str, **options) -> OFACPenaltyScraper:
+    """A scraper pointed at the local fixture server, without a rate limit."""
+    scraper = OFACPenaltyScraper(db_path=db_path, requests_per_second=None, **options)
+    scraper.penalties_url = f"http://127.0.0.1:{server.server_address[1]}"
+    scraper.base_url = f"{scraper.penalties_url}/{LISTING_PATH}"
+    return scraper
+
+def fixture_pdfs(root: str) -> list:
+    media = os.path.join(root, "media")
+    return sorted(os.path.join(dirpath, name) for dirpath, _, names in os.walk(media) for name in names)
+
+def bench_scrape(server, workdir: str, **options) -> dict:
+    """A full scrape into an empty database, then an unchanged re-scrape."""
+    results = {}
+    db_path = os.path.join(workdir, "scrape.db")
+    scraper = fixture_scraper(server, db_path, **options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, cold = timed(scraper.scrape_and_store, FIRST_YEAR, datetime.now().year)
+        _, warm = timed(scraper.scrape_and_store, FIRST_YEAR, datetime.now().year)
+
+    conn = database.connect(db_path)
+    stored = conn.execute("SELECT COUNT(*) FROM penalties").fetchone()[0]
+    # Where the cold scrape spent its time, as recorded in scrape_runs
+    cold_metrics = json.loads(conn.execute("SELECT metrics FROM scrape_runs ORDER BY id LIMIT 1").fetchone()[0])
+    conn.close()
+    results['scrape_cold'] = summarize([cold], stored, "penalties")
+    results['scrape_cold']['breakdown'] = {key: cold_metrics[key] for key in ('stages', 'counters')}
+    results['scrape_unchanged'] = summarize([warm], datetime.now().year - FIRST_YEAR + 1, "listing pages")
+    return results
+
+def bench_parse(root: str, repeat: int) -> dict:
+    """Each listing page of the fixture corpus parsed with every available parser backend."""
+    pages = [os.path.join(dirpath, name)
+             for dirpath, _, names in os.walk(os.path.join(root, LISTING_PATH)) for name in names]
+    htmls = []
+    for path in sorted(pages):
+        with open(path, encoding="utf-8") as f:
+            htmls.append(f.read())
+
+    results = {}
+    for backend in listing_parser.BACKENDS:
+        if backend == 'lxml' and listing_parser.lxml is None:
+            continue
+        samples = []
+        entries = 0
+        for _ in range(max(1, repeat // 10)):
+            for html in htmls:
+                parsed, elapsed = timed(listing_parser.parse_listing, html, "https://ofac.treasury.gov", backend)
+                samples.append(elapsed)
+                entries += len(parsed or {})
+        results[f'parse_{backend}'] = summarize(samples, unit="pages")
+        results[f'parse_{backend}']['entries_per_s'] = round(entries / sum(samples), 2) if samples else None
+    return results
+
+def bench_download(server, root: str, workdir: str, limit: int) -> dict:
+    """Sequential PDF downloads from the fixture server, through the scraper's session."""
+    scraper = fixture_scraper(server, os.path.join(workdir, "download.db"))
+    samples = []
+    total_bytes = 0
+    for path in fixture_pdfs(root)[:limit]:
+        url = scraper.penalties_url + "/" + os.path.relpath(path, root).replace(os.sep, "/")
+        (spooled_path, _, _), elapsed = timed(scraper.download_pdf, url)
+        samples.append(elapsed)
+        if spooled_path:
+            total_bytes += os.path.getsize(spooled_path)
+            os.remove(spooled_path)
+    result = summarize(samples, unit="PDFs")
+    result['mb_per_s'] = round(total_bytes / 1e6 / sum(samples), 2) if samples else None
+    return {'download': result}
+
+def bench_extract(root: str, limit: int) -> dict:
+    """Each fixture PDF extracted with every installed extraction backend."""
+    pdfs = []
+    for path in fixture_pdfs(root)[:limit]:
+        with open(path, "rb") as f:
+            pdfs.append(f.read())
+    total_bytes = sum(len(pdf_content) for pdf_content in pdfs)
+
+    results = {}
+    for backend in pdf_extraction.available_backends():
+        samples = []
+        pages = chars = failures = 0
+        for pdf_content in pdfs:
+            with contextlib.redirect_stdout(io.StringIO()):
+                text, elapsed = timed(pdf_extraction.extract_pdf_text, pdf_content, [backend])
+            samples.append(elapsed)
+            if text is None:
+                failures += 1
+            else:
+                pages += text.count("\f") + 1
+                chars += len(text)
+        result = summarize(samples, unit="PDFs")
+        result.update(pages=pages, chars=chars, failures=failures)
+        result['pages_per_s'] = round(pages / sum(samples), 2) if samples else None
+        result['mb_per_s'] = round(total_bytes / 1e6 / sum(samples), 2) if samples else None
+        results[f'extract_{backend}'] = result
+    return results
+
+def bench_extract_split(workdir: str, pages: int, workers: int, seed: int = 0) -> dict:
+    """One long synthetic PDF extracted whole and split into page ranges, on a process pool."""
+    rnd = random.Random(seed)
+    path = os.path.join(workdir, "long.pdf")
+    long_pages = []
+    while len(long_pages) < pages:
+        long_pages += synthetic_pages(rnd, synthetic_name(rnd, 0))
+    with open(path, "wb") as f:
+        f.write(make_pdf(long_pages[:pages]))
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for name, split_pages in (('extract_long_whole', None), ('extract_long_split', 1)):
+            samples = []
+            for _ in range(3):
+                (text, _, _), elapsed = timed(pdf_extraction.extract_in_pool, pool, path,
+                                              split_pages=split_pages, workers=workers)
+                samples.append(elapsed)
+            results[name] = summarize(samples, unit="PDFs")
+            results[name]['pages'] = text.count("\f") + 1 if text else 0
+    return results
+
+def build_search_db(db_path: str, penalties: int, seed: int = 0, batch_size: int = 1000) -> list:
+    """Fill a database with synthetic penalties and PDF pages. Returns the entity names."""
+    rnd = random.Random(seed)
+    scraper = OFACPenaltyScraper(db_path=db_path)
+    conn = scraper.get_db_connection()
+    cursor = conn.cursor()
+    current_year = datetime.now().year
+    names = []
+    batch = []
+    for i in range(penalties):
+        year = FIRST_YEAR + i % (current_year - FIRST_YEAR + 1)
+        name = synthetic_name(rnd, i)
+        names.append(name)
+        pdf_url = f"https://ofac.treasury.gov/media/{i}/download"
+        penalty_date = date(year, i % 12 + 1, i % 28 + 1)
+        entry = {
+            'id': database.penalty_key(penalty_date, name, pdf_url),
+            'date': penalty_date,
+            'revision_date': None,
+            'name': name,
+            'penalties': rnd.randint(1, 40),
+            'amount': float(rnd.randint(1000, 10 ** 8))
+        }
+        batch.append((pdf_url, "\f".join(synthetic_pages(rnd, name)), [entry]))
+        if len(batch) >= batch_size or i == penalties - 1:
+            scraper._insert_entries(cursor, batch)
+            conn.commit()
+            batch = []
+    scraper.close_db_connection()
+    return names
+
+def bench_search(db_path: str, names: list, repeat: int, seed: int = 0) -> dict:
+    """First result pages, counts, matching pages and excerpts for a mix of queries."""
+    # Imported here: the web app module pulls in Streamlit
+    import webpage
+
+    rnd = random.Random(seed)
+    conn = database.connect(db_path, read_only=True)
+    start_date, end_date = date(FIRST_YEAR, 1, 1), date.today()
+    queries = []
+    for _ in range(repeat):
+        name = rnd.choice(names)
+        queries += [
+            (name.split()[0], webpage.SearchType.EXACT),
+            (" ".join(name.split()[:2]), webpage.SearchType.EXACT),
+            ("iran export", webpage.SearchType.AND),
+            ("cuba vessel insurance", webpage.SearchType.OR),
+            (rnd.choice(VOCABULARY[len(DOMAIN_WORDS):]), webpage.SearchType.AND),
+        ]
+
+    stages = {stage: [] for stage in ('search_newest', 'search_relevance', 'count', 'matching_pages',
+                                       'page_excerpts', 'find_excerpts')}
+    excerpt_pages = 0
+    for search_text, search_type in queries:
+        args = (search_text, search_type, start_date, end_date, conn)
+        _, elapsed = timed(webpage.search_penalties, *args, limit=20)
+        stages['search_newest'].append(elapsed)
+        results, elapsed = timed(webpage.search_penalties, *args, limit=20,
+                                 sort_order=webpage.SortOrder.RELEVANCE)
+        stages['search_relevance'].append(elapsed)
+        _, elapsed = timed(webpage.count_penalties, *args)
+        stages['count'].append(elapsed)
+
+        pages, elapsed = timed(webpage.get_matching_pages, [result[5] for result in results],
+                               search_text, search_type, conn)
+        stages['matching_pages'].append(elapsed)
+        for pdf_pages in pages.values():
+            excerpt_pages += len(pdf_pages)
+            _, elapsed = timed(webpage.find_page_windows, pdf_pages, search_text, search_type)
+            stages['page_excerpts'].append(elapsed)
+            _, elapsed = timed(webpage.find_excerpts, "\f".join(text for _, text in pdf_pages),
+                               search_text, search_type)
+            stages['find_excerpts'].append(elapsed)
+    conn.close()
+
+    results = {stage: summarize(samples, unit="queries" if stage in ('search_newest', 'search_relevance',
+                                                                      'count', 'matching_pages') else "PDFs")
+               for stage, samples in stages.items()}
+    results['page_excerpts']['pages'] = excerpt_pages
+    return results
+
+def bench_imports(repeat: int) -> dict:
+    """Cold import of the web page and the scraper, each in a fresh interpreter, as on a new container."""
+    script = ("import json, sys, time; start = time.perf_counter(); import {module}; "
+              "print(json.dumps([time.perf_counter() - start, [name for name in {heavy!r} if name in sys.modules]]))")
+    results = {}
+    for module in IMPORT_MODULES:
+        samples = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", script.format(module=module, heavy=HEAVY_MODULES)],
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            elapsed, loaded = json.loads(output.splitlines()[-1])
+            samples.append(elapsed)
+        results[f'import_{module}'] = summarize(samples, unit="imports")
+        results[f'import_{module}']['heavy_modules'] = loaded
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark imports, scraping, extraction, search and excerpts offline.")
+    parser.add_argument('--fixtures', help="fixture corpus directory, generated there if empty "
+                                           "(default: a temporary directory)")
+    parser.add_argument('--record', action='store_true', help="record the real site into --fixtures first")
+    parser.add_argument('--fixture-scale', type=float, default=1.0,
+                        help="size of a generated fixture corpus, in multiples of the live site")
+    parser.add_argument('--scale', type=float, default=10.0,
+                        help="size of the synthetic search database, in multiples of the live site")
+    parser.add_argument('--stages', default="imports,scrape,download,parse,extract,search",
+                        help="comma-separated stages to run")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads')
+    parser.add_argument('--fetch-workers', type=int, default=8)
+    parser.add_argument('--extract-workers', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=200, help="PDFs timed one by one in download/extract")
+    parser.add_argument('--long-pdf-pages', type=int, default=400,
+                        help="pages of the synthetic PDF extracted whole and split in the extract stage")
+    parser.add_argument('--repeat', type=int, default=20, help="rounds of search queries")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    report = {
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': database.sqlite3.sqlite_version,
+        'cpu_count': os.cpu_count(),
+        'options': vars(args),
+        'stages': {}
+    }
+
+    if 'imports' in stages:
+        report['stages'].update(bench_imports(max(3, args.repeat // 4)))
+
+    with tempfile.TemporaryDirectory(prefix="ofac-bench-") as workdir:
+        root = args.fixtures or os.path.join(workdir, "fixtures")
+        if stages & {'scrape', 'download', 'parse', 'extract'}:
+            if args.record:
+                record_fixtures(root)
+            elif not os.path.exists(os.path.join(root, "corpus.json")):
+                generate_fixtures(root, int(BASELINE_PENALTIES * args.fixture_scale), args.seed)
+            with open(os.path.join(root, "corpus.json")) as f:
+                report['fixtures'] = json.load(f)
+
+            server = serve_fixtures(root)
+            try:
+                if 'scrape' in stages:
+                    report['stages'].update(bench_scrape(
+                        server, workdir, engine=args.engine,
+                        fetch_workers=args.fetch_workers, extract_workers=args.extract_workers
+                    ))
+                if 'download' in stages:
+                    report['stages'].update(bench_download(server, root, workdir, args.limit))
+            finally:
+                server.shutdown()
+            if 'parse' in stages:
+                report['stages'].update(bench_parse(root, args.repeat))
+            if 'extract' in stages:
+                report['stages'].update(bench_extract(root, args.limit))
+                report['stages'].update(bench_extract_split(
+                    workdir, args.long_pdf_pages, args.extract_workers or os.cpu_count(), args.seed
+                ))
+
+        if 'search' in stages:
+            db_path = os.path.join(workdir, "search.db")
+            penalties = int(BASELINE_PENALTIES * args.scale)
+            names, elapsed = timed(build_search_db, db_path, penalties, args.seed)
+            report['search_db'] = {
+                'penalties': penalties,
+                'build_s': round(elapsed, 2),
+                'size_mb': round(os.path.getsize(db_path) / 1e6, 2)
+            }
+            report['stages'].update(bench_search(db_path, names, args.repeat, args.seed))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import hashlib
+import sqlite3
+import zlib
+from pathlib import Path
+
+DB_PATH = "ofac_penalties.db"
+# Seconds a connection waits for another connection's lock before giving up
+BUSY_TIMEOUT = 30
+
+# Boilerplate shared by most enforcement releases. Compressed text is encoded against
+# it, so it must never change; a new dictionary needs a new format byte
+TEXT_DICTIONARY_V1 = (
+    "U.S. Department of the Treasury Office of Foreign Assets Control (OFAC) Enforcement Release "
+    "civil monetary penalty settlement agreement apparent violations of the Iranian Transactions and "
+    "Sanctions Regulations, Cuban Assets Control Regulations, Weapons of Mass Destruction Proliferators "
+    "Sanctions Regulations, Ukraine-/Russia-Related Sanctions Regulations, Specially Designated Nationals "
+    "and Blocked Persons List (SDN List) blocked property interests of a person whose property and "
+    "interests in property are blocked The statutory maximum civil monetary penalty applicable in this "
+    "matter is $ OFAC determined that the apparent violations were not voluntarily self-disclosed and "
+    "were non-egregious. The base civil monetary penalty applicable in this matter equals the sum of "
+    "one-half of the transaction value for each apparent violation OFAC determined the following to be "
+    "aggravating factors: OFAC determined the following to be mitigating factors: the Company has not "
+    "received a penalty notice or Finding of Violation from OFAC in the five years preceding the date of "
+    "the earliest transaction giving rise to the apparent violations took remedial measures upon "
+    "discovery of the apparent violations, cooperated with OFAC’s investigation, sanctions compliance "
+    "program Compliance Considerations This enforcement action highlights the importance of The "
+    "settlement amount reflects OFAC’s consideration of the General Factors under OFAC’s Economic "
+    "Sanctions Enforcement Guidelines, 31 C.F.R. part 501, app. A. ENTITIES – 31 CFR 501.805(d)(1)(i) "
+    "Information concerning the civil penalties process is discussed in OFAC regulations governing the "
+    "various sanctions programs and in 31 CFR part 501. OFAC’s Economic Sanctions Enforcement "
+    "Guidelines, as well as recent final civil penalties and enforcement information, can be found on "
+    "OFAC’s website at www.treasury.gov/ofac/enforcement. For more information regarding OFAC "
+    "regulations, please go to: www.treasury.gov/ofac."
+).encode()
+
+def pack_text(text: str, compress: bool = True):
+    """
+    Stored form of document text: zlib-compressed against TEXT_DICTIONARY_V1 behind a
+    format byte, or the text itself when `compress` is off.
+    """
+    if not compress or text is None:
+        return text
+    compressor = zlib.compressobj(9, zdict=TEXT_DICTIONARY_V1)
+    return b"\x01" + compressor.compress(text.encode()) + compressor.flush()
+
+def unpack_text(value):
+    """
+    The text of a stored pdf_pages.text or pdf_cache.pdf_text value, compressed or not.
+    Also available in SQL on connections from connect() as unpack_text(column).
+    """
+    if not isinstance(value, bytes):
+        return value
+    if value[:1] == b"\x01":
+        return zlib.decompressobj(zdict=TEXT_DICTIONARY_V1).decompress(value[1:]).decode()
+    raise ValueError(f"Unknown text storage format {value[:1]!r}")
+
+def register_functions(conn: sqlite3.Connection):
+    conn.create_function("unpack_text", 1, unpack_text, deterministic=True)
+
+def connect(path: str = DB_PATH, read_only: bool = False, **kwargs) -> sqlite3.Connection:
+    """
+    Open the database in WAL mode with a busy timeout. Readers then see the last committed
+    snapshot while the scraper writes, instead of waiting for it or seeing a partial year.
+    Read-only connections can't take write locks at all.
+    """
+    if read_only:
+        uri = Path(path).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, **kwargs)
+        register_functions(conn)
+        return conn
+    
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, **kwargs)
+    register_functions(conn)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, syncing at checkpoints rather than every commit is still crash-safe
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def penalty_key(date, name: str, pdf_url: str, occurrence: int = 0) -> str:
+    """
+    Stable penalty ID derived from its date, name and PDF. `occurrence` tells apart
+    identical rows on the same listing page, in page order.
+    """
+    return hashlib.sha1(f"{date}|{name}|{pdf_url}|{occurrence}".encode()).hexdigest()[:16]
+
+def table_exists(cursor, name: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,))
+    return cursor.fetchone() is not None
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+def setup_database(conn: sqlite3.Connection, compress_text: bool = True):
+    """
+    Create any missing tables and indexes, migrating older databases in place. Text moved
+    by a migration is stored through pack_text(text, compress_text).
+    """
+    register_functions(conn)
+    cursor = conn.cursor()
+
+    # Create penalties table with revision_date column if it does not exist
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS penalties (
+            id TEXT PRIMARY KEY,
+            date DATE,
+            revision_date DATE,
+            name TEXT,
+            aggregate_penalties_settlements_findings INTEGER,
+            penalties_settlements_usd_total REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Year and date range filters are answered from this index
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_penalties_date ON penalties (date)")
+
+    # Create PDFs table if it does not exist
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS penalties_pdfs (
+            pdf_url TEXT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Pages used to be keyed by URL and page number only; the id is also their
+    # rowid in the full-text index, which is rebuilt below
+    if table_exists(cursor, 'pdf_pages') and not column_exists(cursor, 'pdf_pages', 'id'):
+        cursor.execute("ALTER TABLE pdf_pages RENAME TO pdf_pages_unnumbered")
+        cursor.execute("DROP TABLE IF EXISTS pdf_pages_fts")
+
+    # Text of each PDF page (stored through pack_text), with the page's offset
+    # in the whole document (the pages joined by form feeds)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_pages (
+            id INTEGER PRIMARY KEY,
+            pdf_url TEXT NOT NULL,
+            page_no INTEGER NOT NULL,
+            char_offset INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            UNIQUE (pdf_url, page_no)
+        )
+    ''')
+
+    if table_exists(cursor, 'pdf_pages_unnumbered'):
+        cursor.execute("""
+            INSERT INTO pdf_pages (pdf_url, page_no, char_offset, text)
+            SELECT pdf_url, page_no, char_offset, text FROM pdf_pages_unnumbered
+        """)
+        cursor.execute("DROP TABLE pdf_pages_unnumbered")
+
+    # Older databases stored each PDF's text as one blob without page breaks.
+    # It is kept as page 0, meaning the real page numbers are unknown, until the
+    # PDF is extracted again (queued below)
+    legacy_text = column_exists(cursor, 'penalties_pdfs', 'pdf_text')
+    if legacy_text:
+        cursor.execute("SELECT pdf_url, pdf_text FROM penalties_pdfs WHERE pdf_text IS NOT NULL")
+        cursor.executemany("""
+            INSERT OR IGNORE INTO pdf_pages (pdf_url, page_no, char_offset, text)
+            VALUES (?, 0, 0, ?)
+        """, [(pdf_url, pack_text(pdf_text, compress_text)) for pdf_url, pdf_text in cursor.fetchall()])
+        cursor.execute("DROP TABLE IF EXISTS penalties_pdfs_fts")
+        cursor.execute("ALTER TABLE penalties_pdfs DROP COLUMN pdf_text")
+        # Cached text from then has no page breaks either, so download and extract those PDFs again
+        if table_exists(cursor, 'pdf_cache'):
+            cursor.execute("DELETE FROM pdf_cache")
+            cursor.execute("DELETE FROM pdf_sources")
+
+    # Links each penalty to the PDF(s) it is published in
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS penalty_pdf (
+            penalty_id TEXT NOT NULL,
+            pdf_url TEXT NOT NULL,
+            PRIMARY KEY (penalty_id, pdf_url)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_penalty_pdf_pdf_url ON penalty_pdf (pdf_url)")
+
+    # Older databases kept the links as a comma-separated linked_penalties column
+    if column_exists(cursor, 'penalties_pdfs', 'linked_penalties'):
+        cursor.execute("""
+            INSERT OR IGNORE INTO penalty_pdf (penalty_id, pdf_url)
+            SELECT TRIM(links.value), pdf.pdf_url
+            FROM penalties_pdfs pdf,
+                 json_each('["' || REPLACE(pdf.linked_penalties, ',', '","') || '"]') links
+            WHERE TRIM(links.value) != ''
+        """)
+        cursor.execute("ALTER TABLE penalties_pdfs DROP COLUMN linked_penalties")
+
+    # Validators of each yearly listing page, so unchanged pages can be skipped
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS listing_pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Content-addressed cache of extracted PDF text (pages joined by form feeds,
+    # stored through pack_text),
+    # plus the content hash and validators last seen for each PDF URL. Neither is
+    # touched when a year is re-scraped, so unchanged PDFs are not downloaded or
+    # extracted again
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_cache (
+            sha256 TEXT PRIMARY KEY,
+            pdf_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_sources (
+            pdf_url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Single-row state of the background refresh, which doubles as its lock
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refresh_status (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            state TEXT NOT NULL DEFAULT 'idle',
+            owner TEXT,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            last_success_at TIMESTAMP,
+            new_entries INTEGER,
+            error TEXT
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO refresh_status (id, state) VALUES (1, 'idle')")
+
+    # PDFs whose text could not be downloaded or extracted, retried by later scrapes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_failures (
+            pdf_url TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            first_failed_at TIMESTAMP,
+            last_failed_at TIMESTAMP
+        )
+    ''')
+
+    # Queue the migrated page-0 PDFs on the retry path so the next scrape extracts them
+    # again with page breaks; their old text stays searchable until then
+    if legacy_text:
+        cursor.execute("""
+            INSERT OR IGNORE INTO pdf_failures (pdf_url, stage, error, attempts, first_failed_at, last_failed_at)
+            SELECT pdf_url, 'migrate', 'Stored without page breaks', 0, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM pdf_pages WHERE page_no = 0
+        """)
+
+    # One row per scrape, with its stage timers, counters and per-year summaries as
+    # JSON (see metrics.ScrapeMetrics.snapshot)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            id INTEGER PRIMARY KEY,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP,
+            engine TEXT,
+            start_year INTEGER,
+            end_year INTEGER,
+            force BOOLEAN,
+            status TEXT NOT NULL,
+            error TEXT,
+            metrics TEXT
+        )
+    ''')
+
+    # Progress of backfill jobs (see backfill.py): the state of each year and the process
+    # working on it, and the state of each new PDF of those years
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_years (
+            job TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            claimed_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (job, year)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_pdfs (
+            job TEXT NOT NULL,
+            pdf_url TEXT NOT NULL,
+            year INTEGER,
+            state TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (job, pdf_url)
+        )
+    ''')
+
+    # Full-text indexes over penalty names and PDF pages, filled from the
+    # existing rows the first time they are created
+    if not table_exists(cursor, 'penalties_fts'):
+        cursor.execute("CREATE VIRTUAL TABLE penalties_fts USING fts5(id UNINDEXED, name)")
+        cursor.execute("INSERT INTO penalties_fts (id, name) SELECT id, name FROM penalties")
+
+    # The page index keeps no copy of the text (contentless); its rowids are
+    # pdf_pages ids, and removing a page needs the page's text (see delete_page_index)
+    if not table_exists(cursor, 'pdf_pages_fts'):
+        cursor.execute("CREATE VIRTUAL TABLE pdf_pages_fts USING fts5(text, content='')")
+        index_pages(cursor, "SELECT id FROM pdf_pages")
+
+    # Older databases identified penalties by their position on the listing page
+    cursor.execute("SELECT 1 FROM penalties WHERE id GLOB '*-[0-9][0-9][0-9][0-9]' LIMIT 1")
+    if cursor.fetchone():
+        migrate_positional_ids(cursor)
+
+    conn.commit()
+    # Dropping the old text column leaves its pages free in the file; return them once
+    if legacy_text:
+        conn.execute("VACUUM")
+
+def index_pages(cursor, ids_query: str, params=()):
+    """Add the pages whose ids `ids_query` selects to the full-text index."""
+    cursor.execute(f"""
+        INSERT INTO pdf_pages_fts (rowid, text)
+        SELECT id, unpack_text(text) FROM pdf_pages WHERE id IN ({ids_query})
+    """, params)
+
+def delete_page_index(cursor, ids_query: str, params=()):
+    """Remove the pages whose ids `ids_query` selects from the full-text index."""
+    cursor.execute(f"""
+        INSERT INTO pdf_pages_fts (pdf_pages_fts, rowid, text)
+        SELECT 'delete', id, unpack_text(text) FROM pdf_pages WHERE id IN ({ids_query})
+    """, params)
+
+def migrate_positional_ids(cursor):
+    """Re-key penalties stored as '{index}-{year}' with their stable penalty_key."""
+    cursor.execute("""
+        SELECT p.id, p.date, p.name, COALESCE(MIN(link.pdf_url), '')
+        FROM penalties p
+        LEFT JOIN penalty_pdf link ON link.penalty_id = p.id
+        WHERE p.id GLOB '*-[0-9][0-9][0-9][0-9]'
+        GROUP BY p.id
+    """)
+    # Number identical rows in the order they were listed on the page
+    rows = sorted(cursor.fetchall(), key=lambda row: int(row[0].split('-')[0]))
+    occurrences = {}
+    renames = []
+    for old_id, date, name, pdf_url in rows:
+        occurrence = occurrences.get((date, name, pdf_url), 0)
+        occurrences[(date, name, pdf_url)] = occurrence + 1
+        renames.append((penalty_key(date, name, pdf_url, occurrence), old_id))
+
+    cursor.executemany("UPDATE penalties SET id = ? WHERE id = ?", renames)
+    cursor.executemany("UPDATE penalty_pdf SET penalty_id = ? WHERE penalty_id = ?", renames)
+
+    # Rebuild the name index rather than rewriting its unindexed IDs one by one
+    cursor.execute("DELETE FROM penalties_fts")
+    cursor.execute("INSERT INTO penalties_fts (id, name) SELECT id, name FROM penalties")
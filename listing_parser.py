@@ -0,0 +1,140 @@
+"""
+Parser for OFAC's yearly enforcement listing pages.
+
+Only the `usa-table` holding the penalties is parsed: with lxml when it is installed,
+otherwise with BeautifulSoup restricted to that table by a SoupStrainer. Each row is
+read once into a ListingEntry, which both the diff against the database and the
+writer use as is.
+"""
+import re
+from datetime import date
+from typing import Dict, Optional, TypedDict
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+import database
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+class ListingEntry(TypedDict):
+    id: str
+    date: date
+    revision_date: Optional[date]
+    name: str
+    penalties: float
+    amount: float
+    pdf_url: str
+
+DATE_PATTERN = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+NUMBER_PATTERN = re.compile(r'[\d,]+(?:\.\d+)?')
+# Matches the class attribute of the penalties table in XPath, as BeautifulSoup's class_ does
+TABLE_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' usa-table ')]"
+
+def extract_number(text: str):
+    """Extracts the first numeric value from a given text."""
+    match = NUMBER_PATTERN.search(text)
+    if match:
+        # Remove commas for conversion to float
+        return float(match.group(0).replace(',', ''))
+    return 0  # Return 0 if no number is found
+
+def extract_dates(date_str: str):
+    """Extracts the main date and revision date from the date string."""
+    parts = date_str.split(' (Revised ')
+    main_date_str = parts[0].strip()
+    revision_date_str = parts[1].replace(')', '').strip() if len(parts) > 1 else None
+    return main_date_str, revision_date_str
+
+def parse_date(date_str: str) -> date:
+    """Parse an MM/DD/YYYY date, raising ValueError like datetime.strptime does."""
+    match = DATE_PATTERN.fullmatch(date_str)
+    if not match:
+        raise ValueError(f"time data {date_str!r} does not match format '%m/%d/%Y'")
+    month, day, year = match.groups()
+    return date(int(year), int(month), int(day))
+
+def _rows_lxml(html: str):
+    """(date text, link, name, penalties text, amount text) of each penalty row, via lxml."""
+    try:
+        tables = lxml.html.fromstring(html).xpath(TABLE_XPATH) if html.strip() else []
+    except ValueError:
+        # lxml refuses str input carrying an XML encoding declaration; re-encoding it could
+        # contradict the declaration, so parse such pages like the bs4 backend does
+        return _rows_bs4(html)
+    if not tables:
+        return None
+    rows = []
+    for row in list(tables[0].iter('tr'))[1:-1]:  # Skip header row and totals row
+        cells = row.xpath('.//th|.//td')
+        links = cells[0].xpath('.//a') if len(cells) == 4 else []
+        if links:
+            rows.append((links[0].text_content(), links[0].get('href'),
+                         *(cell.text_content() for cell in cells[1:])))
+    return rows
+
+def _is_penalties_table(classes) -> bool:
+    # While parsing, the strainer sees the class attribute as one unsplit string
+    return classes is not None and 'usa-table' in classes.split()
+
+def _rows_bs4(html: str):
+    """(date text, link, name, penalties text, amount text) of each penalty row, via BeautifulSoup."""
+    soup = BeautifulSoup(html, 'html.parser', parse_only=SoupStrainer('table', class_=_is_penalties_table))
+    table = soup.find('table')
+    if not table:
+        return None
+    rows = []
+    for row in table.find_all('tr')[1:-1]:  # Skip header row and totals row
+        cells = row.find_all(['th', 'td'])
+        link = cells[0].find('a') if len(cells) == 4 else None
+        if link:
+            rows.append((link.text, link['href'], *(cell.text for cell in cells[1:])))
+    return rows
+
+BACKENDS = {'lxml': _rows_lxml, 'bs4': _rows_bs4}
+DEFAULT_BACKEND = 'lxml' if lxml else 'bs4'
+
+def parse_listing(html: str, base_url: str, backend: str = None) -> Optional[Dict[str, ListingEntry]]:
+    """
+    Entries of a listing page keyed by their stable ID, in page order, or None if it has
+    no penalties table. Relative PDF links are resolved against `base_url`.
+    """
+    rows = BACKENDS[backend or DEFAULT_BACKEND](html)
+    if rows is None:
+        return None
+
+    entries = {}
+    occurrences = {}
+    for date_text, pdf_url, name, penalties_text, amount_text in rows:
+        # Strip any hidden characters
+        date_str = date_text.strip().encode('ascii', 'ignore').decode('ascii').strip()
+        main_date_str, revision_date_str = extract_dates(date_str)
+        try:
+            entry_date = parse_date(main_date_str)
+            revision_date = parse_date(revision_date_str) if revision_date_str else None
+        except ValueError:
+            print(f"Invalid date format: {date_str}")
+            continue
+
+        if pdf_url.startswith('/'):
+            pdf_url = base_url + pdf_url
+        name = name.strip()
+
+        # Create a stable ID from the date, name and PDF; identical
+        # rows are told apart by their order on the page
+        occurrence = occurrences.get((entry_date, name, pdf_url), 0)
+        occurrences[(entry_date, name, pdf_url)] = occurrence + 1
+        unique_id = database.penalty_key(entry_date, name, pdf_url, occurrence)
+
+        entries[unique_id] = ListingEntry(
+            id=unique_id,
+            date=entry_date,
+            revision_date=revision_date,
+            name=name,
+            penalties=extract_number(penalties_text.strip()),
+            amount=extract_number(amount_text.strip()),
+            pdf_url=pdf_url
+        )
+    return entries
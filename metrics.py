@@ -0,0 +1,189 @@
+"""
+Stage timers and counters for scraper runs.
+
+OFACPenaltyScraper records where a run spends its time (listing fetches, parsing,
+diffing, PDF downloads, extraction, the text cache and commits) and what it moved
+(requests, retries, bytes, cache hits) in a ScrapeMetrics, overall and per year.
+Each year's summary and the final totals are passed to the hooks given to the
+scraper, and the totals are saved with the run in the scrape_runs table.
+
+A hook is any callable taking an event name ('year' or 'run') and a JSON-ready dict:
+
+    scraper = OFACPenaltyScraper(metrics_hooks=[JsonLinesHook("scrape.jsonl"), PrometheusHook(9108)])
+"""
+import http.server
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+class ScrapeMetrics:
+    """Thread-safe stage timers and counters, kept overall and per year."""
+
+    def __init__(self, hooks: list = None):
+        self.hooks = list(hooks or [])
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.years = {}
+
+    def _year(self, year) -> dict:
+        return self.years.setdefault(year, {'stages': {}, 'counters': {}})
+
+    def record(self, stage: str, seconds: float, year: int = None):
+        """Add one timed call of a stage."""
+        with self.lock:
+            targets = [self.stages] + ([self._year(year)['stages']] if year is not None else [])
+            for stages in targets:
+                totals = stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                totals['calls'] += 1
+                totals['seconds'] += seconds
+                totals['max_seconds'] = max(totals['max_seconds'], seconds)
+
+    @contextmanager
+    def timer(self, stage: str, year: int = None):
+        """Time the body of a with block as one call of a stage, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, year)
+
+    def add(self, counter: str, value: int = 1, year: int = None):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+            if year is not None:
+                counters = self._year(year)['counters']
+                counters[counter] = counters.get(counter, 0) + value
+
+    def year_summary(self, year: int) -> dict:
+        with self.lock:
+            summary = self._year(year)
+            return {'year': year, 'stages': _rounded(summary['stages']), 'counters': dict(summary['counters'])}
+
+    def snapshot(self) -> dict:
+        """Totals so far, with the elapsed time and per-year summaries."""
+        with self.lock:
+            return {
+                'elapsed_seconds': round(time.perf_counter() - self.started, 4),
+                'stages': _rounded(self.stages),
+                'counters': dict(self.counters),
+                'years': {
+                    str(year): {'stages': _rounded(summary['stages']), 'counters': dict(summary['counters'])}
+                    for year, summary in sorted(self.years.items())
+                }
+            }
+
+    def emit(self, event: str, record: dict):
+        """Pass a record to every hook. A failing hook is reported but never fails the run."""
+        for hook in self.hooks:
+            try:
+                hook(event, record)
+            except Exception as e:
+                print(f"Error in metrics hook {hook!r}: {e}")
+
+    def emit_year(self, year: int):
+        self.emit('year', self.year_summary(year))
+
+def _rounded(stages: dict) -> dict:
+    return {
+        stage: {'calls': totals['calls'], 'seconds': round(totals['seconds'], 4),
+                'max_seconds': round(totals['max_seconds'], 4)}
+        for stage, totals in stages.items()
+    }
+
+class LoggingHook:
+    """Log each record as one line of JSON, at INFO on the 'ofac.metrics' logger by default."""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("ofac.metrics")
+        self.level = level
+
+    def __call__(self, event: str, record: dict):
+        self.logger.log(self.level, json.dumps({'event': event, **record}))
+
+class JsonLinesHook:
+    """Append each record to a file as one line of JSON, stamped with the time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, event: str, record: dict):
+        line = json.dumps({'event': event, 'time': datetime.now().isoformat(timespec='seconds'), **record})
+        with self.lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+class PrometheusHook:
+    """
+    Serve stage timers and counters in the Prometheus text format at
+    http://<host>:<port>/metrics, from a daemon thread. Totals accumulate over every
+    run this hook sees, and include the years finished so far of a run in progress.
+    """
+
+    def __init__(self, port: int, host: str = "0.0.0.0"):
+        self.lock = threading.Lock()
+        self.totals = {'stages': {}, 'counters': {}}
+        self.current = {'stages': {}, 'counters': {}}
+        self.runs = 0
+        hook = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = hook.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def __call__(self, event: str, record: dict):
+        with self.lock:
+            if event == 'year':
+                _merge(self.current, record)
+            elif event == 'run':
+                # A run's totals include its years, so they replace what was counted so far
+                _merge(self.totals, record)
+                self.current = {'stages': {}, 'counters': {}}
+                self.runs += 1
+
+    def render(self) -> str:
+        with self.lock:
+            combined = {'stages': {}, 'counters': {}}
+            _merge(combined, self.totals)
+            _merge(combined, self.current)
+            runs = self.runs
+        lines = ["# TYPE ofac_scrape_runs_total counter", f"ofac_scrape_runs_total {runs}"]
+        lines.append("# TYPE ofac_scrape_stage_seconds_total counter")
+        lines += [f'ofac_scrape_stage_seconds_total{{stage="{stage}"}} {round(totals["seconds"], 4)}'
+                  for stage, totals in sorted(combined['stages'].items())]
+        lines.append("# TYPE ofac_scrape_stage_calls_total counter")
+        lines += [f'ofac_scrape_stage_calls_total{{stage="{stage}"}} {totals["calls"]}'
+                  for stage, totals in sorted(combined['stages'].items())]
+        for counter, value in sorted(combined['counters'].items()):
+            lines += [f"# TYPE ofac_scrape_{counter}_total counter", f"ofac_scrape_{counter}_total {value}"]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self.server.shutdown()
+
+def _merge(into: dict, record: dict):
+    """Add the stage timers and counters of a record to running totals."""
+    for stage, totals in record['stages'].items():
+        merged = into['stages'].setdefault(stage, {'calls': 0, 'seconds': 0.0})
+        merged['calls'] += totals['calls']
+        merged['seconds'] += totals['seconds']
+    for counter, value in record['counters'].items():
+        into['counters'][counter] = into['counters'].get(counter, 0) + value
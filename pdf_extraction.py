@@ -0,0 +1,235 @@
+"""
+PDF text extraction with interchangeable backends.
+
+PyPDF2 is always installed; pypdf, pdfminer.six and pdfplumber are used when they
+are. A PDF goes to each of the configured backends in turn until one can read it,
+so a document one parser chokes on can still be indexed by another. Large PDFs can
+be split into page ranges extracted in parallel on a process pool.
+
+benchmark.py compares the backends' throughput on the fixture corpus:
+
+    python benchmark.py --stages extract
+"""
+import contextlib
+import importlib.util
+import io
+import os
+import signal
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# PDFs smaller than this are never split into page ranges
+SPLIT_MIN_BYTES = 512 * 1024
+# Page ranges of a split PDF are at least this long
+MIN_PAGES_PER_RANGE = 10
+
+def _page_range(page_count: int, pages: tuple = None) -> range:
+    start, stop = pages or (0, page_count)
+    return range(start, min(stop, page_count))
+
+def _pypdf2(pdf_file, pages):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(pdf_file)
+    count = len(reader.pages)
+    return count, [reader.pages[index].extract_text() or "" for index in _page_range(count, pages)]
+
+def _pypdf(pdf_file, pages):
+    import pypdf
+    reader = pypdf.PdfReader(pdf_file)
+    count = len(reader.pages)
+    return count, [reader.pages[index].extract_text() or "" for index in _page_range(count, pages)]
+
+def _pdfminer(pdf_file, pages):
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.layout import LAParams, LTTextContainer
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    pdf_pages = list(PDFPage.get_pages(pdf_file))
+    manager = PDFResourceManager()
+    device = PDFPageAggregator(manager, laparams=LAParams())
+    interpreter = PDFPageInterpreter(manager, device)
+
+    texts = []
+    for index in _page_range(len(pdf_pages), pages):
+        interpreter.process_page(pdf_pages[index])
+        texts.append("".join(element.get_text() for element in device.get_result() if isinstance(element, LTTextContainer)))
+    return len(pdf_pages), texts
+
+def _pdfplumber(pdf_file, pages):
+    import pdfplumber
+    with pdfplumber.open(pdf_file) as pdf:
+        count = len(pdf.pages)
+        return count, [pdf.pages[index].extract_text() or "" for index in _page_range(count, pages)]
+
+# Each backend reads a PDF file object and returns its page count and the text of the
+# pages in the [start, stop) range `pages` (every page if None), releasing the file
+BACKENDS = {
+    'pypdf2': _pypdf2,
+    'pypdf': _pypdf,
+    'pdfminer': _pdfminer,
+    'pdfplumber': _pdfplumber
+}
+BACKEND_MODULES = {'pypdf2': 'PyPDF2', 'pypdf': 'pypdf', 'pdfminer': 'pdfminer', 'pdfplumber': 'pdfplumber'}
+
+def available_backends() -> list:
+    """Backends whose library is installed, in order of preference."""
+    return [name for name in BACKENDS if importlib.util.find_spec(BACKEND_MODULES[name])]
+
+DEFAULT_BACKENDS = available_backends()
+
+def _read_pdf(pdf_content: bytes, backends: list = None, pages: tuple = None):
+    """(page count, page texts) of a PDF from the first of `backends` that reads it without error."""
+    error = None
+    for backend in backends or DEFAULT_BACKENDS:
+        try:
+            return BACKENDS[backend](io.BytesIO(pdf_content), pages)
+        except MemoryError:
+            raise
+        except Exception as e:
+            print(f"Error reading PDF with {backend}: {e}")
+            error = e
+    raise error or ValueError("No PDF extraction backend is installed")
+
+def extract_pdf_pages(pdf_content: bytes, backends: list = None, pages: tuple = None) -> list:
+    """
+    Extract the text of each page of a PDF, or of the pages in the [start, stop) range
+    `pages`, with the first of `backends` that reads it without error.
+    """
+    # Form feeds separate pages in the stored document text
+    return [page_text.replace("\f", " ") for page_text in _read_pdf(pdf_content, backends, pages)[1]]
+
+def extract_pdf_text(pdf_content: bytes, backends: list = None):
+    """
+    Extract the text of a PDF as its pages joined by form feeds. Kept at module
+    level so it can run in a process pool.
+    """
+    try:
+        return "\f".join(extract_pdf_pages(pdf_content, backends))
+    except Exception as e:
+        print(f"Error extracting PDF text: {e}")
+        return None
+
+class ExtractionTimeout(BaseException):
+    """Raised by the extraction time limit; not an Exception, so PDF libraries can't swallow it."""
+
+def _raise_extraction_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+@contextlib.contextmanager
+def time_limit(timeout: float = None):
+    """
+    Raise ExtractionTimeout in the block once `timeout` seconds have passed. Needs the
+    process's main thread, so it applies in extraction pool workers only.
+    """
+    if not (timeout and hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()):
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _raise_extraction_timeout)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+def _run_limited(work, timeout: float = None):
+    """
+    Call work() within time_limit(timeout). Returns its result (None if it failed), how
+    long it took and the error, if any.
+    """
+    start = time.perf_counter()
+    try:
+        with time_limit(timeout):
+            return work(), time.perf_counter() - start, None
+    except ExtractionTimeout:
+        error = f"Extraction took longer than {timeout}s"
+    except MemoryError:
+        error = "Extraction ran out of memory"
+    except Exception as e:
+        error = f"Error extracting PDF text: {e}"
+    print(error)
+    return None, time.perf_counter() - start, error
+
+def extract_pdf_file(pdf_path, timeout: float = None, backends: list = None, pages: tuple = None):
+    """
+    Extract the text of a spooled PDF, or of a [start, stop) range of its pages, giving up
+    after `timeout` seconds (see time_limit). Returns the text (None if it failed), how
+    long it took and the error, if any.
+    """
+    def extract():
+        with open(pdf_path, 'rb') as f:
+            return "\f".join(extract_pdf_pages(f.read(), backends, pages))
+    return _run_limited(extract, timeout)
+
+def pdf_page_count(pdf_path, backends: list = None, timeout: float = None):
+    """
+    Count the pages of a spooled PDF, giving up after `timeout` seconds. Returns the count
+    (None if it failed), how long it took and the error, like extract_pdf_file.
+    """
+    def count():
+        with open(pdf_path, 'rb') as f:
+            return _read_pdf(f.read(), backends, (0, 0))[0]
+    return _run_limited(count, timeout)
+
+def may_split(pdf_path, split_pages: int, workers: int) -> bool:
+    """Whether a spooled PDF is large enough for extract_in_pool to count its pages and maybe split it."""
+    return bool(split_pages) and workers > 1 and os.path.getsize(pdf_path) >= SPLIT_MIN_BYTES
+
+def page_ranges(page_count: int, workers: int, split_pages: int):
+    """
+    [start, stop) page ranges to extract a PDF in parallel on `workers` processes, or None
+    if it has fewer than `split_pages` pages and is extracted whole.
+    """
+    if not split_pages or workers < 2 or page_count < split_pages:
+        return None
+    size = max(MIN_PAGES_PER_RANGE, -(-page_count // workers))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def combine_extractions(results: list):
+    """Join the extract_pdf_file results of consecutive page ranges into one."""
+    seconds = sum(result[1] for result in results)
+    for pdf_text, _, error in results:
+        if pdf_text is None:
+            return None, seconds, error
+    return "\f".join(result[0] for result in results), seconds, None
+
+def extract_in_pool(pool, pdf_path, timeout: float = None, backends: list = None,
+                    split_pages: int = None, workers: int = 1):
+    """
+    Extract a spooled PDF on a process pool and wait for the result. PDFs of at least
+    SPLIT_MIN_BYTES and `split_pages` pages are split into page ranges across `workers`.
+    """
+    if may_split(pdf_path, split_pages, workers):
+        page_count, seconds, error = pool.submit(pdf_page_count, pdf_path, backends, timeout).result()
+        if page_count is None:
+            return None, seconds, error
+        ranges = page_ranges(page_count, workers, split_pages)
+        if ranges:
+            futures = [pool.submit(extract_pdf_file, pdf_path, timeout, backends, pages) for pages in ranges]
+            return combine_extractions([future.result() for future in futures])
+    return pool.submit(extract_pdf_file, pdf_path, timeout, backends).result()
+
+def limit_extraction_memory(budget_mb: int):
+    """
+    Extraction pool initializer: cap the worker's address space at its size when started
+    plus `budget_mb`, so a runaway PDF raises MemoryError in the worker instead of
+    exhausting the machine.
+    """
+    if not budget_mb or resource is None:
+        return
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        current = 0
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + budget_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
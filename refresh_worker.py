@@ -0,0 +1,171 @@
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+
+# How often the current year is checked for new resolutions
+REFRESH_INTERVAL = timedelta(hours=24)
+# A refresh still marked as running after this long is assumed to have died
+STALE_AFTER = timedelta(hours=6)
+
+def connect() -> sqlite3.Connection:
+    conn = database.connect()
+    database.setup_database(conn)
+    return conn
+
+def get_refresh_status(conn: sqlite3.Connection) -> dict:
+    """The state of the current or last refresh, as recorded in the refresh_status table."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT state, owner, started_at, finished_at, last_success_at, new_entries, error
+        FROM refresh_status WHERE id = 1
+    """)
+    row = cursor.fetchone()
+    columns = ['state', 'owner', 'started_at', 'finished_at', 'last_success_at', 'new_entries', 'error']
+    status = dict(zip(columns, row)) if row else dict.fromkeys(columns)
+    for column in ('started_at', 'finished_at', 'last_success_at'):
+        if status[column]:
+            status[column] = datetime.fromisoformat(status[column])
+    return status
+
+def refresh_due(status: dict, force: bool = False) -> bool:
+    """
+    Whether `status` allows a refresh to be claimed, by the same rules as try_start_refresh.
+    Lets readers check without opening a writable connection.
+    """
+    now = datetime.now()
+    if status['state'] == 'running' and status['started_at'] and status['started_at'] >= now - STALE_AFTER:
+        return False
+    return force or not status['last_success_at'] or status['last_success_at'] < now - REFRESH_INTERVAL
+
+def try_start_refresh(conn: sqlite3.Connection, owner: str, force: bool = False) -> bool:
+    """
+    Claim the single refresh slot. Succeeds only if no other refresh is running and,
+    unless `force` is set, the last successful one is older than REFRESH_INTERVAL.
+    """
+    now = datetime.now()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE refresh_status
+        SET state = 'running', owner = ?, started_at = ?, error = NULL
+        WHERE id = 1
+        AND (state != 'running' OR started_at < ?)
+        AND (? OR last_success_at IS NULL OR last_success_at < ?)
+    """, (owner, now.isoformat(), (now - STALE_AFTER).isoformat(), force, (now - REFRESH_INTERVAL).isoformat()))
+    conn.commit()
+    return cursor.rowcount == 1
+
+def finish_refresh(conn: sqlite3.Connection, owner: str, new_entries: int = None, error: str = None):
+    """Release the refresh slot, recording the outcome."""
+    now = datetime.now().isoformat()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE refresh_status
+        SET state = ?,
+            finished_at = ?,
+            last_success_at = CASE WHEN ? IS NULL THEN ? ELSE last_success_at END,
+            new_entries = ?,
+            error = ?
+        WHERE id = 1 AND owner = ?
+    """, ('failed' if error else 'idle', now, error, now, new_entries, error, owner))
+    conn.commit()
+
+def run_refresh(owner: str, **scraper_options):
+    """Scrape the current year for a refresh already claimed by `owner`."""
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM penalties")
+        initial_count = cursor.fetchone()[0]
+
+        # Imported here so the web page only loads the scraping stack when a refresh runs
+        from scraper import OFACPenaltyScraper
+
+        current_year = datetime.now().year
+        scraper = OFACPenaltyScraper(**scraper_options)
+        scraper.scrape_and_store(current_year, current_year)
+
+        cursor.execute("SELECT COUNT(*) FROM penalties")
+        finish_refresh(conn, owner, new_entries=cursor.fetchone()[0] - initial_count)
+
+    except Exception as e:
+        print(f"Error refreshing resolutions: {e}")
+        finish_refresh(conn, owner, error=str(e))
+    finally:
+        conn.close()
+
+def start_background_refresh(force: bool = False, engine: str = 'threads') -> bool:
+    """
+    Start a refresh on a daemon thread if one is due and none is running in any
+    process. Returns immediately; whether a refresh was started. Expects the database
+    to be set up already.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}:{time.time()}"
+    conn = database.connect()
+    try:
+        if not try_start_refresh(conn, owner, force):
+            return False
+    finally:
+        conn.close()
+
+    # One extraction process keeps the per-PDF timeout and memory cap in force; it is
+    # spawned rather than forked so it doesn't copy the web server
+    thread = threading.Thread(
+        target=run_refresh, args=(owner,),
+        kwargs={'extract_workers': 1, 'extract_start_method': 'spawn', 'engine': engine},
+        name="ofac-refresh", daemon=True
+    )
+    thread.start()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Check OFAC for new enforcement resolutions.")
+    parser.add_argument('--force', action='store_true', help="refresh even if the last one is recent")
+    parser.add_argument('--loop', action='store_true', help="keep running, refreshing whenever one is due")
+    parser.add_argument('--poll-minutes', type=int, default=15, help="how often --loop checks if a refresh is due")
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help="scraping engine ('async' requires httpx)")
+    parser.add_argument('--metrics-file', help="append stage timings and counters to this file as JSON lines")
+    parser.add_argument('--prometheus-port', type=int, help="serve stage timings and counters for Prometheus on this port")
+    args = parser.parse_args()
+    # The default hook logs each year's timings and counters at INFO level
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    # Imported here, like the scraper, to keep the web page's imports light
+    import metrics
+    metrics_hooks = [metrics.LoggingHook()]
+    if args.metrics_file:
+        metrics_hooks.append(metrics.JsonLinesHook(args.metrics_file))
+    if args.prometheus_port:
+        metrics_hooks.append(metrics.PrometheusHook(args.prometheus_port))
+
+    while True:
+        owner = f"{socket.gethostname()}:{os.getpid()}:{time.time()}"
+        conn = connect()
+        try:
+            started = try_start_refresh(conn, owner, args.force)
+        finally:
+            conn.close()
+
+        if started:
+            run_refresh(owner, engine=args.engine, metrics_hooks=metrics_hooks)
+            conn = connect()
+            try:
+                print(f"Refresh finished: {get_refresh_status(conn)}")
+            finally:
+                conn.close()
+        else:
+            print("No refresh due, or another refresh is running.")
+
+        if not args.loop:
+            break
+        args.force = False
+        time.sleep(args.poll_minutes * 60)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,17 @@
+import argparse
+import backfill
 from scraper import OFACPenaltyScraper
-import sqlite3
+from database import connect, pack_text, setup_database
 from datetime import datetime
 
 def repair_2024_ids():
     """
     Repairs IDs for 2024 records that were incorrectly stored with 2025.
+    setup_database now re-keys positional IDs from each record's date, name and
+    PDF, which already fixes them, so this normally finds nothing to repair.
     """
-    conn = sqlite3.connect('ofac_penalties.db')
+    conn = connect()
+    setup_database(conn)
     cursor = conn.cursor()
     
     try:
@@ -33,12 +38,15 @@ def repair_2024_ids():
                 WHERE id = ?
             """, (new_id, old_id))
             
-            # Update the linked_penalties in the PDFs table
+            # Update the links to the PDFs table
             cursor.execute("""
-                UPDATE penalties_pdfs
-                SET linked_penalties = REPLACE(linked_penalties, ?, ?)
-                WHERE linked_penalties LIKE ?
-            """, (old_id, new_id, f"%{old_id}%"))
+                UPDATE penalty_pdf
+                SET penalty_id = ?
+                WHERE penalty_id = ?
+            """, (new_id, old_id))
+            
+            # Keep the full-text index pointing at the new ID
+            cursor.execute("UPDATE penalties_fts SET id = ? WHERE id = ?", (new_id, old_id))
             
             count += 1
         
@@ -52,11 +60,13 @@ def repair_2024_ids():
     finally:
         conn.close()
 
-def erase_database():
+def erase_database(include_pdf_cache: bool = False):
     """
-    Erases all records from both the penalties and penalties_pdfs tables.
+    Erases all records from both the penalties and penalties_pdfs tables. The PDF cache is
+    kept so a re-scrape does not extract every PDF again, unless `include_pdf_cache` is set.
     """
-    conn = sqlite3.connect('ofac_penalties.db')
+    conn = connect()
+    setup_database(conn)
     cursor = conn.cursor()
     
     try:
@@ -69,6 +79,17 @@ def erase_database():
         # Delete all records from both tables
         cursor.execute("DELETE FROM penalties")
         cursor.execute("DELETE FROM penalties_pdfs")
+        cursor.execute("DELETE FROM penalty_pdf")
+        cursor.execute("DELETE FROM listing_pages")
+        cursor.execute("DELETE FROM pdf_failures")
+        cursor.execute("DELETE FROM backfill_years")
+        cursor.execute("DELETE FROM backfill_pdfs")
+        if include_pdf_cache:
+            cursor.execute("DELETE FROM pdf_cache")
+            cursor.execute("DELETE FROM pdf_sources")
+        cursor.execute("DELETE FROM penalties_fts")
+        cursor.execute("DELETE FROM pdf_pages")
+        cursor.execute("INSERT INTO pdf_pages_fts (pdf_pages_fts) VALUES ('delete-all')")
         
         conn.commit()
         print(f"Successfully erased {penalties_count} penalties and {pdfs_count} PDF records from the database")
@@ -80,11 +101,86 @@ def erase_database():
     finally:
         conn.close()
 
-def re_scrape_all_data():
-    current_year = datetime.now().year
-    scraper = OFACPenaltyScraper()
-    scraper.scrape_and_store(start_year=2003, end_year=current_year)
+def compress_stored_text():
+    """
+    Compresses page and cached PDF text stored before compression was enabled, then
+    vacuums the database to return the freed space.
+    """
+    conn = connect()
+    setup_database(conn)
+    cursor = conn.cursor()
+    
+    try:
+        for table, key, column in (('pdf_pages', 'id', 'text'), ('pdf_cache', 'sha256', 'pdf_text')):
+            cursor.execute(f"SELECT {key}, {column} FROM {table} WHERE typeof({column}) = 'text'")
+            rows = cursor.fetchall()
+            cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE {key} = ?",
+                               [(pack_text(text), key_value) for key_value, text in rows])
+            print(f"Compressed {len(rows)} rows of {table}")
+        
+        conn.commit()
+        conn.execute("VACUUM")
+        
+    except Exception as e:
+        conn.rollback()
+        print(f"Error compressing stored text: {e}")
+        
+    finally:
+        conn.close()
+
+def backfill_progress(job: str = 'rescrape') -> dict:
+    """Number of a backfill job's years and PDFs in each state, and the years not stored yet."""
+    conn = connect()
+    setup_database(conn)
+    try:
+        return backfill.progress(conn.cursor(), job)
+    finally:
+        conn.close()
+
+def re_scrape_all_data(fetch_workers: int = 8, extract_workers: int = None, engine: str = 'threads',
+                       start_year: int = 2003, end_year: int = None, job: str = 'rescrape', restart: bool = False):
+    """
+    Re-scrapes every year since 2003, or from `start_year` to `end_year`, as the backfill
+    `job`. Each year and PDF is checkpointed (see backfill.py), so rerunning an interrupted
+    backfill resumes where it stopped, and processes given disjoint year ranges can run at
+    once. Once every year is stored the job is closed, so running it again starts over.
+    `restart` scrapes the range's years again even if the unfinished job stored them.
+    PDFs are downloaded `fetch_workers` at a time and their text extracted by
+    `extract_workers` processes (defaults to the CPU count). `engine` is 'threads' or
+    'async' (requires httpx).
+    """
+    end_year = end_year or datetime.now().year
+    if restart:
+        conn = connect()
+        setup_database(conn)
+        try:
+            backfill.reset(conn.cursor(), job, start_year, end_year)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    scraper = OFACPenaltyScraper(fetch_workers=fetch_workers, extract_workers=extract_workers, engine=engine)
+    scraper.scrape_and_store(start_year=start_year, end_year=end_year, checkpoint=backfill.Backfill(job))
+    progress = backfill_progress(job)
+    if progress['years']:
+        print(f"Backfill {job} not finished, run it again to resume: {progress}")
+    else:
+        print(f"Backfill {job} finished")
 
 # repair_2024_ids()
 # erase_database()
-# re_scrape_all_data()
\ No newline at end of file
+# re_scrape_all_data()
+# compress_stored_text()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-scrape a range of years as a resumable backfill.")
+    parser.add_argument('--start-year', type=int, default=2003)
+    parser.add_argument('--end-year', type=int, help="last year to scrape (default: the current year)")
+    parser.add_argument('--job', default='rescrape', help="backfill to resume or start")
+    parser.add_argument('--restart', action='store_true', help="scrape the years again even if already stored")
+    parser.add_argument('--fetch-workers', type=int, default=8)
+    parser.add_argument('--extract-workers', type=int, default=None)
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads')
+    args = parser.parse_args()
+    re_scrape_all_data(args.fetch_workers, args.extract_workers, args.engine,
+                       args.start_year, args.end_year, args.job, args.restart)
@@ -1,27 +1,314 @@
+import asyncio
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import sqlite3
-import PyPDF2
-import io
+import json
+import multiprocessing
 import os
+import hashlib
+import queue
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
-import re  # Make sure to import the regular expression module
+import database
+import listing_parser
+import metrics
+from pdf_extraction import extract_in_pool, extract_pdf_file, extract_pdf_text, limit_extraction_memory, may_split
+
+# Downloaded PDFs are written to their spool file in chunks of this many bytes
+PDF_CHUNK_SIZE = 64 * 1024
+# PDFs that failed this many times are no longer retried
+MAX_PDF_ATTEMPTS = 5
+
+def remove_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class PdfTooLarge(Exception):
+    pass
+
+class PdfSpool:
+    """
+    Temporary file a PDF is streamed into, hashed on the way. Writing more than `max_size`
+    bytes, or starting a download whose Content-Length says it would, raises PdfTooLarge.
+    """
+
+    def __init__(self, max_size: int = None, directory: str = None, content_length: str = None):
+        self.max_size = max_size
+        if max_size and content_length and content_length.isdigit() and int(content_length) > max_size:
+            raise PdfTooLarge(f"PDF is {int(content_length)} bytes, more than the limit of {max_size}")
+        self.file = tempfile.NamedTemporaryFile(prefix="ofac-", suffix=".pdf", dir=directory, delete=False)
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_size and self.size > self.max_size:
+            raise PdfTooLarge(f"PDF is more than the limit of {self.max_size} bytes")
+        self.file.write(chunk)
+        self.sha256.update(chunk)
+
+    def close(self) -> str:
+        """Finish writing and return the file's path; the caller removes it."""
+        self.file.close()
+        return self.file.name
+
+    def discard(self):
+        self.file.close()
+        remove_file(self.file.name)
+
+class PdfPipeline:
+    """
+    Downloads PDFs on a thread pool, extracts their text on a process pool and
+    hands the results to a single writer thread. The writer applies each year's
+    changes in one transaction once all of the year's new PDFs have arrived.
+    """
+
+    def __init__(self, scraper, fetch_workers: int, extract_workers: int):
+        self.scraper = scraper
+        self.extract_pool = ProcessPoolExecutor(
+            max_workers=extract_workers, initializer=limit_extraction_memory, initargs=(scraper.extract_memory_mb,),
+            mp_context=multiprocessing.get_context(scraper.extract_start_method)
+        ) if extract_workers else None
+        if self.extract_pool:
+            # Start the worker processes before any of our threads exist
+            self.extract_pool.submit(int).result()
+        self.fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="pdf-fetch")
+        # PDFs whose bytes hash to one of these skip extraction
+        self.cached_hashes = scraper.get_cached_pdf_hashes()
+        # Bound the number of PDFs held in memory between download and storage
+        self.slots = threading.BoundedSemaphore(fetch_workers * 4)
+        self.results = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_results, name="pdf-writer")
+        self.writer.start()
+
+    def submit_year(self, year, pdf_penalties, updated, removed_ids):
+        """
+        Queue a year's changes: new penalties grouped by the PDF they link to, changed
+        penalties and the IDs of penalties that are no longer listed.
+        """
+        batch = {
+            'year': year,
+            'inserts': [],
+            'updates': updated,
+            'removed_ids': removed_ids,
+            'pending': len(pdf_penalties),
+            'total': len(pdf_penalties)
+        }
+        if not pdf_penalties:
+            self.results.put((batch, None))
+        for pdf_url, penalties in pdf_penalties.items():
+            self._submit_pdf(batch, pdf_url, penalties)
+        return batch
+
+    def submit_retries(self, pdf_urls: list):
+        """Queue the PDFs of stored penalties whose text failed to download or extract before."""
+        if pdf_urls:
+            self.submit_year(None, {pdf_url: [] for pdf_url in pdf_urls}, [], [])
+
+    def _submit_pdf(self, batch, pdf_url, penalties):
+        source = self.scraper.get_pdf_source(pdf_url)
+        self.slots.acquire()
+        future = self.fetch_pool.submit(self.scraper.download_pdf, pdf_url, source, batch['year'])
+        future.add_done_callback(lambda f: self._extract(batch, pdf_url, penalties, f))
+
+    def _extract(self, batch, pdf_url, penalties, fetch_future):
+        pdf_path = None
+        try:
+            pdf_path, source, error = fetch_future.result()
+            if pdf_path is None or self.scraper.text_cached(source, self.cached_hashes, batch['year']):
+                # Failed, not modified since the last download, or text already extracted
+                remove_file(pdf_path)
+                self.results.put((batch, (pdf_url, None, penalties, source, error)))
+            elif self.extract_pool is None:
+                result = extract_pdf_file(pdf_path, self.scraper.extract_timeout, self.scraper.extract_backends)
+                remove_file(pdf_path)
+                pdf_text, error = self.scraper.record_extraction(result, batch['year'])
+                self.results.put((batch, (pdf_url, pdf_text, penalties, source, error)))
+            elif may_split(pdf_path, self.scraper.split_pages, self.scraper.extract_workers):
+                # Possibly long enough to split across the pool; this download thread
+                # waits for the page ranges so they're submitted before the pool closes
+                result = extract_in_pool(
+                    self.extract_pool, pdf_path, self.scraper.extract_timeout, self.scraper.extract_backends,
+                    self.scraper.split_pages, self.scraper.extract_workers
+                )
+                remove_file(pdf_path)
+                pdf_text, error = self.scraper.record_extraction(result, batch['year'])
+                self.results.put((batch, (pdf_url, pdf_text, penalties, source, error)))
+            else:
+                future = self.extract_pool.submit(
+                    extract_pdf_file, pdf_path, self.scraper.extract_timeout, self.scraper.extract_backends
+                )
+                future.add_done_callback(lambda f: self._extracted(batch, pdf_url, pdf_path, penalties, source, f))
+        except Exception as e:
+            print(f"Error processing PDF {pdf_url}: {e}")
+            remove_file(pdf_path)
+            self.results.put((batch, (pdf_url, None, penalties, None, str(e))))
+
+    def _extracted(self, batch, pdf_url, pdf_path, penalties, source, extract_future):
+        try:
+            pdf_text, error = self.scraper.record_extraction(extract_future.result(), batch['year'])
+        except Exception as e:
+            # The worker died, e.g. killed by the system
+            print(f"Error extracting PDF text: {e}")
+            pdf_text, error = None, f"Error extracting PDF text: {e}"
+        remove_file(pdf_path)
+        self.results.put((batch, (pdf_url, pdf_text, penalties, source, error)))
+
+    def _write_results(self):
+        try:
+            while True:
+                item = self.results.get()
+                if item is None:
+                    break
+                batch, pdf_result = item
+                try:
+                    if pdf_result:
+                        self.scraper.store_pdf_result(batch, *pdf_result)
+                    else:
+                        # A batch without PDFs to wait for; the others are applied by store_pdf_result
+                        self.scraper.apply_batch(batch)
+                except Exception as e:
+                    # Keep writing the other years; this one isn't stored, so its listing
+                    # validators aren't saved and the next scrape tries it again
+                    print(f"Error storing results for year {batch['year']}: {e}")
+                    batch['committed'] = False
+                    self.scraper.get_db_connection().rollback()
+                finally:
+                    if pdf_result:
+                        self.slots.release()
+        finally:
+            self.scraper.close_db_connection()
+
+    def close(self):
+        """Wait for every queued PDF to be downloaded, extracted and stored."""
+        if self.closed:
+            return
+        self.closed = True
+        self.fetch_pool.shutdown(wait=True)
+        if self.extract_pool:
+            self.extract_pool.shutdown(wait=True)
+        self.results.put(None)
+        self.writer.join()
+
+class RateLimiter:
+    """Spaces out requests from every thread sharing it to at most `rate` per second."""
+    def __init__(self, rate: float = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def reserve(self) -> float:
+        """Claim the next request slot and return how long to wait for it."""
+        if not self.interval:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        return max(delay, 0.0)
+
+    def wait(self):
+        time.sleep(self.reserve())
 
 class OFACPenaltyScraper:
-    def __init__(self):
+    def __init__(
+        self,
+        fetch_workers: int = 8,
+        extract_workers: int = None,
+        pool_size: int = None,
+        timeout: tuple = (10, 60),
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        requests_per_second: float = 5.0,
+        engine: str = 'threads',
+        compress_text: bool = True,
+        db_path: str = None,
+        metrics_hooks: list = None,
+        parser: str = None,
+        max_pdf_size: int = 64 * 1024 * 1024,
+        extract_timeout: float = 120,
+        extract_memory_mb: int = 2048,
+        extract_start_method: str = None,
+        spool_dir: str = None,
+        extract_backends: list = None,
+        split_pages: int = 50
+    ):
         # Remove hardcoded year from base URL
         self.base_url = "https://ofac.treasury.gov/civil-penalties-and-enforcement-information"
         self.penalties_url = "https://ofac.treasury.gov"
-        self.db_path = "ofac_penalties.db"
+        self.db_path = db_path or database.DB_PATH
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        # Number of concurrent PDF downloads and PDF text extraction processes
+        # (0 extraction processes extracts on the download threads instead)
+        self.fetch_workers = fetch_workers
+        self.extract_workers = os.cpu_count() if extract_workers is None else extract_workers
+        # One keep-alive session for every request, with a connection per download thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_size or fetch_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # (connect, read) timeouts in seconds, and retries of failed or throttled requests
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Shared by all threads, so raising fetch_workers doesn't raise the request rate
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.pool_size = pool_size or fetch_workers
+        # 'threads' downloads on a thread pool; 'async' uses the asyncio engine in async_engine.py
+        self.engine = engine
+        # Store page and cached PDF text compressed (see database.pack_text)
+        self.compress_text = compress_text
+        # Stage timers and counters of the current or last run, passed to these hooks
+        # as each year is stored and when the run ends (see metrics.py)
+        self.metrics_hooks = metrics_hooks or []
+        self.metrics = metrics.ScrapeMetrics(self.metrics_hooks)
+        # Listing page parser backend, 'lxml' or 'bs4' (default: lxml if installed)
+        self.listing_parser = parser
+        # PDFs are streamed to temporary files in spool_dir (default: the system's) and
+        # abandoned past max_pdf_size bytes. Each extraction pool worker gets
+        # extract_timeout seconds per PDF and extract_memory_mb MB on top of its own size.
+        # Failed PDFs are recorded in pdf_failures and retried by the next scrape.
+        # Pool workers are started with extract_start_method ('fork', 'spawn' or
+        # 'forkserver'; default: the platform's).
+        self.max_pdf_size = max_pdf_size
+        self.extract_timeout = extract_timeout
+        self.extract_memory_mb = extract_memory_mb
+        self.extract_start_method = extract_start_method
+        self.spool_dir = spool_dir
+        # PDF text extraction backends tried in turn (default: every installed one, see
+        # pdf_extraction.py). PDFs of split_pages pages or more are extracted as page
+        # ranges in parallel across the extraction pool; None extracts them whole.
+        self.extract_backends = extract_backends
+        self.split_pages = split_pages
+        # Progress of the backfill being scraped, if any (see backfill.py)
+        self.checkpoint = None
+        # Each thread gets its own connection; the PDF writer thread stores rows
+        # while the main thread diffs the next year
+        self._local = threading.local()
         self.conn = None
         self.setup_database()
 
+    @property
+    def conn(self):
+        return getattr(self._local, 'conn', None)
+
+    @conn.setter
+    def conn(self, value):
+        self._local.conn = value
+
     def get_db_connection(self):
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = database.connect(self.db_path)
         return self.conn
 
     def close_db_connection(self):
@@ -30,249 +317,754 @@ class OFACPenaltyScraper:
             self.conn = None
 
     def setup_database(self):
-        conn = self.get_db_connection()
-        cursor = conn.cursor()
-        
-        # Create penalties table with revision_date column if it does not exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS penalties (
-                id TEXT PRIMARY KEY,
-                date DATE,
-                revision_date DATE,
-                name TEXT,
-                aggregate_penalties_settlements_findings INTEGER,
-                penalties_settlements_usd_total REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create PDFs table with linked_penalties column if it does not exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS penalties_pdfs (
-                pdf_url TEXT PRIMARY KEY,
-                pdf_text TEXT,
-                linked_penalties TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
+        database.setup_database(self.get_db_connection(), self.compress_text)
 
-    def scrape_and_store(self, start_year: int = None, end_year: int = None):
+    def scrape_and_store(self, start_year: int = None, end_year: int = None, force: bool = False,
+                         checkpoint=None):
+        """
+        Scrape each year's listing page and store new or changed resolutions. Listing pages
+        that are unchanged since the last run are skipped unless `force` is set. With a
+        backfill `checkpoint` (a backfill.Backfill), only the years it hasn't stored and no
+        other process claimed are scraped, and each year's and PDF's progress is recorded.
+        """
         current_year = datetime.now().year
         start_year = start_year or current_year
         end_year = end_year or current_year
 
-        with sqlite3.connect(self.db_path) as conn:
+        self.metrics = metrics.ScrapeMetrics(self.metrics_hooks)
+        self.checkpoint = checkpoint
+        run_id = self.start_run(start_year, end_year, force)
+        try:
+            if self.engine == 'async':
+                # Imported here so httpx is only needed by the async engine
+                from async_engine import scrape_and_store_async
+                asyncio.run(scrape_and_store_async(self, start_year, end_year, force))
+            else:
+                self._scrape_with_threads(start_year, end_year, force)
+        except BaseException as e:
+            self.finish_run(run_id, error=str(e) or type(e).__name__)
+            raise
+        finally:
+            self.release_checkpoint()
+        self.finish_run(run_id)
+
+    def _scrape_with_threads(self, start_year: int, end_year: int, force: bool):
+        current_year = datetime.now().year
+        with database.connect(self.db_path) as conn:
             self.conn = conn  # Store the connection in the instance
+            pipeline = PdfPipeline(self, self.fetch_workers, self.extract_workers)
+            checked_listings = []
             
             try:
-                for year in range(start_year, end_year + 1):
-                    # Get the number of entries on the webpage for this year
-                    url = self.base_url if year == current_year else f"{self.base_url}/{year}-enforcement-information"
+                years = self.years_to_scrape(start_year, end_year)
+                # PDFs that failed in earlier runs; their listing pages may be unchanged
+                pipeline.submit_retries(self.get_failed_pdfs(years if self.checkpoint else None))
+
+                for year in years:
+                    url = self.listing_url(year, current_year)
                     try:
-                        response = requests.get(url, headers=self.headers)
-                        soup = BeautifulSoup(response.text, 'html.parser')
+                        with self.metrics.timer('listing_fetch', year):
+                            listing = self.fetch_listing_page(url, force)
+                        if listing is None:
+                            self.metrics.add('listings_unchanged', year=year)
+                            print(f"Year {year}: Listing page unchanged. Skipping...")
+                            self.record_year_checked(year)
+                            continue
+                        response, validators = listing
+                        self.metrics.add('listing_bytes', len(response.content), year)
                         
-                        table = soup.find('table', class_='usa-table')
-                        if not table:
+                        with self.metrics.timer('listing_parse', year):
+                            web_entries = self.parse_listing(response.text)
+                        if web_entries is None:
                             print(f"No table found for year {year}")
                             continue
-
-                        rows = table.find_all('tr')[1:-1]  # Skip header row and totals row
-                        web_entries = []
                         
-                        # Extract data from web page
-                        for index, row in enumerate(rows):
-                            cells = row.find_all(['th', 'td'])
-                            if len(cells) == 4:
-                                date_cell = cells[0].find('a')
-                                if date_cell:
-                                    date_str = date_cell.text.strip().encode('ascii', 'ignore').decode('ascii').strip()
-                                    main_date_str, revision_date_str = self.extract_dates(date_str)
-                                    name = cells[1].text.strip()
-                                    penalties = self.extract_number(cells[2].text.strip())
-                                    amount = self.extract_number(cells[3].text.strip())
-                                    web_entries.append({
-                                        'date': main_date_str,
-                                        'revision_date': revision_date_str,
-                                        'name': name,
-                                        'penalties': penalties,
-                                        'amount': amount
-                                    })
-
-                        should_rescrape = False
-                        reason = None
-
-                        # Compare with database entries
-                        db_entries = self.get_entries_for_year(year)
-                        
-                        if len(web_entries) != len(db_entries):
-                            should_rescrape = True
-                            reason = f"Entry count mismatch - Web: {len(web_entries)}, DB: {len(db_entries)}"
-                        else:
-                            # Compare each entry's properties
-                            for web_entry in web_entries:
-                                matching_db_entry = next(
-                                    (db_entry for db_entry in db_entries 
-                                     if datetime.strptime(web_entry['date'], '%m/%d/%Y').date() == db_entry['date']
-                                     and web_entry['name'] == db_entry['name']),
-                                    None
-                                )
-                                
-                                if not matching_db_entry:
-                                    should_rescrape = True
-                                    reason = f"New entry found: {web_entry['name']} on {web_entry['date']}"
-                                    break
-                                
-                                if (web_entry['penalties'] != matching_db_entry['penalties'] or
-                                    web_entry['amount'] != matching_db_entry['amount']):
-                                    should_rescrape = True
-                                    reason = f"Data changed for {web_entry['name']}"
-                                    break
-
-                        if should_rescrape:
-                            print(f"Year {year}: Re-scraping needed - {reason}")
-                            self.remove_entries_for_year(year)
-                        else:
-                            print(f"Year {year}: No changes detected. Skipping...")
+                        with self.metrics.timer('diff', year):
+                            changes = self.diff_year(year, web_entries)
+                        self.record_year_checked(year, changes)
+                        if changes is None:
+                            checked_listings.append((url, validators, None))
                             continue
 
-                        # Process each row for scraping
-                        for index, row in enumerate(rows):
-                            cells = row.find_all(['th', 'td'])
-                            if len(cells) == 4:
-                                date_cell = cells[0].find('a')
-                                if date_cell:
-                                    date_str = date_cell.text.strip()
-                                    # Strip any hidden characters
-                                    date_str = date_str.encode('ascii', 'ignore').decode('ascii').strip()
-                                    
-                                    # Extract the main date and revision date
-                                    main_date_str, revision_date_str = self.extract_dates(date_str)
-                                    try:
-                                        date = datetime.strptime(main_date_str, '%m/%d/%Y').date()
-                                        revision_date = datetime.strptime(revision_date_str, '%m/%d/%Y').date() if revision_date_str else None
-                                    except ValueError:
-                                        print(f"Invalid date format: {date_str}")
-                                        continue
-
-                                    pdf_url = date_cell['href']
-                                    if pdf_url.startswith('/'):
-                                        pdf_url = self.penalties_url + pdf_url
-
-                                    name = cells[1].text.strip()
-                                    
-                                    # Extracting the aggregate penalties
-                                    penalties_text = cells[2].text.strip()
-                                    penalties = self.extract_number(penalties_text)
-                                    
-                                    # Extracting the total amount
-                                    amount_text = cells[3].text.strip()
-                                    amount = self.extract_number(amount_text)
-
-                                    # Create a unique ID based on the index and year
-                                    unique_id = f"{index}-{year}"
-
-                                    # Check for existing entry before processing PDF
-                                    if not self.entry_exists(unique_id):
-                                        # Download and extract PDF content
-                                        pdf_text = None
-                                        try:
-                                            response = requests.get(pdf_url, headers=self.headers)
-                                            if response.status_code == 200:
-                                                pdf_text = self.extract_pdf_text(response.content)
-                                        except Exception as e:
-                                            print(f"Error downloading PDF: {e}")
-
-                                        self.store_penalty(unique_id, date, revision_date, name, penalties, amount, pdf_text, pdf_url)
-                                        print(f"Processed: {date} - {name}")
-                                    else:
-                                        print(f"Skipping duplicate ID: {unique_id}")
+                        # Download, extract and store in the background while the next year is diffed
+                        checked_listings.append((url, validators, pipeline.submit_year(year, *changes)))
 
                     except Exception as e:
                         print(f"Error processing year {year}: {e}")
 
+                # Only remember the listing pages once all of their PDFs are stored, and not
+                # those whose changes failed to commit, so the next run tries them again
+                pipeline.close()
+                for url, validators, batch in checked_listings:
+                    if batch is None or batch.get('committed'):
+                        self.save_listing_validators(url, validators)
+
             except Exception as e:
                 print(f"Error in scraping process: {e}")
                 raise e
             finally:
+                pipeline.close()
                 self.conn = None  # Clear the connection reference
 
-    def extract_pdf_text(self, pdf_content):
+    def years_to_scrape(self, start_year: int, end_year: int) -> list:
+        """
+        The years of a scrape: all of them, or for a backfill the ones it claimed, i.e. those
+        not stored yet that no other process is scraping.
+        """
+        years = list(range(start_year, end_year + 1))
+        if self.checkpoint is None:
+            return years
+        
+        conn = self.get_db_connection()
+        claimed = []
+        for year in years:
+            try:
+                if self.checkpoint.claim_year(conn.cursor(), year):
+                    claimed.append(year)
+                else:
+                    self.metrics.add('backfill_years_skipped', year=year)
+                    print(f"Year {year}: Already stored or claimed by another process. Skipping...")
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error claiming year {year}: {e}")
+        return claimed
+
+    def record_year_checked(self, year: int, changes=None):
+        """
+        Record a year's listing as read in the backfill checkpoint: stored if it has no
+        changes, otherwise fetched with its new PDFs pending.
+        """
+        if self.checkpoint is None:
+            return
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if changes is None:
+                self.checkpoint.year_stored(cursor, year)
+            else:
+                self.checkpoint.year_fetched(cursor, year, list(changes[0]))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error recording progress of year {year}: {e}")
+
+    def record_pdf_progress(self, pdf_url, state: str, error: str = None):
+        """Record a PDF's state in the backfill checkpoint."""
+        if self.checkpoint is None:
+            return
+        conn = self.get_db_connection()
+        try:
+            self.checkpoint.pdf_progress(conn.cursor(), pdf_url, state, error)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error recording progress of PDF {pdf_url}: {e}")
+
+    def release_checkpoint(self):
+        """
+        Release the years of the backfill that weren't finished, close the backfill if none
+        are left, and forget it.
+        """
+        if self.checkpoint is None:
+            return
+        try:
+            # A connection of its own, as the engines replace this thread's connection
+            conn = database.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                self.checkpoint.release(cursor)
+                if self.checkpoint.close(cursor):
+                    print(f"Backfill {self.checkpoint.job}: Every year stored, closed")
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error releasing backfill {self.checkpoint.job}: {e}")
+        self.checkpoint = None
+
+    def start_run(self, start_year: int, end_year: int, force: bool) -> int:
+        """Record the start of a scrape in the scrape_runs table and return its ID."""
+        # A connection of its own, as the engines replace this thread's connection
+        conn = database.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO scrape_runs (started_at, engine, start_year, end_year, force, status)
+                VALUES (?, ?, ?, ?, ?, 'running')
+            """, (datetime.now().isoformat(timespec='seconds'), self.engine, start_year, end_year, force))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def finish_run(self, run_id: int, error: str = None):
+        """Record the outcome and metrics of a scrape, and pass them to the metrics hooks."""
+        snapshot = self.metrics.snapshot()
+        status = 'failed' if error else 'succeeded'
         try:
-            pdf_file = io.BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            conn = database.connect(self.db_path)
+            try:
+                conn.execute("""
+                    UPDATE scrape_runs
+                    SET finished_at = ?, status = ?, error = ?, metrics = ?
+                    WHERE id = ?
+                """, (datetime.now().isoformat(timespec='seconds'), status, error, json.dumps(snapshot), run_id))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"Error recording scrape run {run_id}: {e}")
+        self.metrics.emit('run', {'run_id': run_id, 'status': status, 'error': error, **snapshot})
+
+    def listing_url(self, year: int, current_year: int) -> str:
+        """URL of a year's listing page; the current year is listed on the base page."""
+        return self.base_url if year == current_year else f"{self.base_url}/{year}-enforcement-information"
+
+    def parse_listing(self, html: str):
+        """Entries of a listing page keyed by their stable ID, or None if it has no table."""
+        return listing_parser.parse_listing(html, self.penalties_url, self.listing_parser)
+
+    def diff_year(self, year: int, web_entries: dict):
+        """
+        Compare a year's listed entries with the stored ones by ID. Returns None if nothing
+        changed, otherwise the new entries grouped by PDF URL, the changed entries and the
+        IDs of entries that are no longer listed.
+        """
+        db_entries = {entry['id']: entry for entry in self.get_entries_for_year(year)}
+        
+        new_ids = [entry_id for entry_id in web_entries if entry_id not in db_entries]
+        removed_ids = [entry_id for entry_id in db_entries if entry_id not in web_entries]
+        changed = [
+            entry for entry_id, entry in web_entries.items()
+            if entry_id in db_entries and self.entry_changed(entry, db_entries[entry_id])
+        ]
+
+        if not (new_ids or removed_ids or changed):
+            print(f"Year {year}: No changes detected. Skipping...")
+            return None
+
+        print(f"Year {year}: {len(new_ids)} new, {len(changed)} changed, {len(removed_ids)} removed")
+        self.metrics.add('penalties_new', len(new_ids), year)
+        self.metrics.add('penalties_changed', len(changed), year)
+        self.metrics.add('penalties_removed', len(removed_ids), year)
+
+        # Group new rows that share a PDF so it is fetched once
+        pdf_penalties = {}
+        for entry_id in new_ids:
+            pdf_penalties.setdefault(web_entries[entry_id]['pdf_url'], []).append(web_entries[entry_id])
+        # A revised resolution may replace its PDF at the same URL, so the PDFs of changed
+        # rows are revalidated too; unchanged ones come back from the text cache
+        for entry in changed:
+            pdf_penalties.setdefault(entry['pdf_url'], [])
+        
+        return pdf_penalties, changed, removed_ids
+
+    def get_listing_validators(self, url):
+        """Get the ETag, Last-Modified and content hash recorded for a listing page."""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
             
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
+            cursor.execute("""
+                SELECT etag, last_modified, content_hash FROM listing_pages 
+                WHERE url = ?
+            """, (url,))
+            
+            row = cursor.fetchone()
+            if row:
+                return {'etag': row[0], 'last_modified': row[1], 'content_hash': row[2]}
             
-            return text
         except Exception as e:
-            print(f"Error extracting PDF text: {e}")
-            return None
+            print(f"Error getting listing validators for {url}: {e}")
+        return None
 
-    def store_pdf(self, pdf_url, pdf_text, penalty_id):
-        """Store PDF information and return its URL"""
+    def save_listing_validators(self, url, validators):
+        """Record the validators of a listing page whose entries are fully stored."""
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            # Check if PDF already exists
-            cursor.execute("SELECT linked_penalties FROM penalties_pdfs WHERE pdf_url = ?", (pdf_url,))
-            existing_pdf = cursor.fetchone()
-            
-            if existing_pdf:
-                # Update linked_penalties by adding the new penalty_id if not already present
-                linked_penalties = existing_pdf[0]
-                penalties_list = linked_penalties.split(',') if linked_penalties else []
-                if penalty_id not in penalties_list:
-                    penalties_list.append(penalty_id)
-                    new_linked_penalties = ','.join(penalties_list)
-                    cursor.execute("""
-                        UPDATE penalties_pdfs 
-                        SET linked_penalties = ? 
-                        WHERE pdf_url = ?
-                    """, (new_linked_penalties, pdf_url))
-                    conn.commit()
-                return pdf_url
-            
-            # Insert new PDF with initial penalty_id
             cursor.execute("""
-                INSERT INTO penalties_pdfs (pdf_url, pdf_text, linked_penalties, created_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            """, (pdf_url, pdf_text, penalty_id))
+                INSERT OR REPLACE INTO listing_pages (url, etag, last_modified, content_hash, checked_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (url, validators['etag'], validators['last_modified'], validators['content_hash']))
             
             conn.commit()
-            return pdf_url
             
         except Exception as e:
-            print(f"Error storing PDF: {e}")
+            print(f"Error saving listing validators for {url}: {e}")
+
+    def retry_delay(self, attempt: int, retry_after: str = None) -> float:
+        """Exponential backoff with full jitter, or longer if the server asked for it."""
+        delay = random.uniform(0, min(60.0, self.backoff * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def http_get(self, url, headers=None, stream: bool = False):
+        """
+        GET through the shared session, within the rate limit. Connection errors, timeouts,
+        429 and 5xx responses are retried up to max_retries times with backoff. A `stream`
+        response's body is left unread, and the caller must close it.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            self.metrics.add('http_requests')
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                print(f"Error fetching {url}: {e}. Retrying in {delay:.1f}s")
+            else:
+                if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries:
+                    return response
+                delay = self.retry_delay(attempt, response.headers.get('Retry-After'))
+                print(f"{url} returned {response.status_code}. Retrying in {delay:.1f}s")
+                response.close()
+            self.metrics.add('http_retries')
+            time.sleep(delay)
+
+    def fetch_listing_page(self, url, force: bool = False):
+        """
+        Conditionally fetch a listing page. Returns None when the server answers 304 or the
+        body hashes to the same value as last time, otherwise the response and its validators.
+        """
+        stored = None if force else self.get_listing_validators(url)
+        response = self.http_get(url, headers=self.conditional_headers(stored))
+        validators = self.listing_response_validators(response, stored)
+        return (response, validators) if validators else None
+
+    def conditional_headers(self, validators):
+        """Request headers revalidating against the stored ETag and Last-Modified, if any."""
+        headers = dict(self.headers)
+        if validators and validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators and validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def listing_response_validators(self, response, stored):
+        """Validators of a fetched listing page, or None if it is unchanged since `stored`."""
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if stored and stored['content_hash'] == content_hash:
             return None
+        
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash
+        }
 
-    def store_penalty(self, unique_id, date, revision_date, name, penalties, amount, pdf_text, pdf_url):
-        """Store penalty information and link it to PDF"""
+    def download_pdf(self, pdf_url, source=None, year: int = None):
+        """
+        Download a PDF, revalidating against the `source` recorded for its URL. Returns the
+        path of a temporary file holding it (None if not modified or failed), the URL's
+        validators and content hash, and the error if it failed. The caller removes the file.
+        """
+        try:
+            with self.metrics.timer('pdf_download', year):
+                with self.http_get(pdf_url, headers=self.conditional_headers(source), stream=True) as response:
+                    result = self.pdf_response_result(response, source)
+                    if result is None:
+                        spool = PdfSpool(self.max_pdf_size, self.spool_dir, response.headers.get('Content-Length'))
+                        try:
+                            for chunk in response.iter_content(PDF_CHUNK_SIZE):
+                                spool.write(chunk)
+                        except BaseException:
+                            spool.discard()
+                            raise
+                        result = spool.close(), self.pdf_source(response, spool), None
+        except Exception as e:
+            print(f"Error downloading PDF {pdf_url}: {e}")
+            result = None, None, str(e)
+        self.record_download(result, year)
+        return result
+
+    def pdf_response_result(self, response, source):
+        """
+        What download_pdf returns for a PDF response without a body to keep, or None
+        for a 200 response, whose body is to be spooled.
+        """
+        if response.status_code == 304 and source:
+            return None, source, None
+        if response.status_code != 200:
+            return None, None, f"HTTP {response.status_code}"
+        return None
+
+    def pdf_source(self, response, spool: PdfSpool) -> dict:
+        """The validators and content hash of a downloaded PDF."""
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': spool.sha256.hexdigest()
+        }
+
+    def record_download(self, result, year: int = None):
+        """Count the outcome and size of a download_pdf result."""
+        pdf_path, source, _ = result
+        if pdf_path is not None:
+            self.metrics.add('pdf_bytes', os.path.getsize(pdf_path), year)
+        elif source:
+            self.metrics.add('pdfs_not_modified', year=year)
+        else:
+            self.metrics.add('pdf_download_failures', year=year)
+
+    def text_cached(self, source, cached_hashes: set, year: int = None) -> bool:
+        """Whether a downloaded PDF's text is already cached, counting cache hits and misses."""
+        cached = source['sha256'] in cached_hashes
+        self.metrics.add('pdf_cache_hits' if cached else 'pdf_cache_misses', year=year)
+        return cached
+
+    def record_extraction(self, result, year: int = None):
+        """Record an extract_pdf_file result and return its text and error."""
+        pdf_text, seconds, error = result
+        self.metrics.record('pdf_extract', seconds, year)
+        if pdf_text is None:
+            self.metrics.add('pdf_extract_failures', year=year)
+        else:
+            self.metrics.add('pdf_pages', pdf_text.count("\f") + 1, year)
+        return pdf_text, error
+
+    def store_pdf_result(self, batch, pdf_url, pdf_text, penalties, source, error):
+        """
+        Add a downloaded PDF to its batch, caching its text or recording why there is none,
+        and apply the batch once all of its PDFs are in. Called by one writer at a time.
+        """
+        if source:
+            with self.metrics.timer('pdf_cache', batch['year']):
+                pdf_text = self.cache_pdf(pdf_url, source, pdf_text)
+        if pdf_text is None:
+            self.record_pdf_failure(pdf_url, 'extract' if source else 'download', error, batch['year'])
+        self.record_pdf_progress(pdf_url, 'extracted' if pdf_text is not None else 'fetched' if source else 'pending',
+                                 None if pdf_text is not None else error or "No text")
+        batch['inserts'].append((pdf_url, pdf_text, penalties))
+        batch['pending'] -= 1
+        label = f"Year {batch['year']}" if batch['year'] is not None else "Retried PDFs"
+        print(f"{label}: {batch['total'] - batch['pending']}/{batch['total']} PDFs ready")
+        if batch['pending'] == 0:
+            self.apply_batch(batch)
+
+    def apply_batch(self, batch) -> bool:
+        """
+        Apply a year's changes, or store the text of retried PDFs (a batch without a year).
+        Records in the batch, and returns, whether it was committed.
+        """
+        if batch['year'] is None:
+            batch['committed'] = self.store_entries(batch['inserts'])
+        else:
+            batch['committed'] = self.apply_year_changes(
+                batch['year'], batch['inserts'], batch['updates'], batch['removed_ids']
+            )
+        return batch['committed']
+
+    def record_pdf_failure(self, pdf_url, stage: str, error: str, year: int = None):
+        """Record that a PDF's text could not be downloaded or extracted, so it is retried."""
+        self.metrics.add('pdf_failures', year=year)
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO pdf_failures (pdf_url, stage, error, attempts, first_failed_at, last_failed_at)
+                VALUES (?, ?, ?, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (pdf_url) DO UPDATE SET
+                    stage = excluded.stage,
+                    error = excluded.error,
+                    attempts = attempts + 1,
+                    last_failed_at = excluded.last_failed_at
+            """, (pdf_url, stage, error or "No text"))
+            
+            conn.commit()
+            
+        except Exception as e:
+            print(f"Error recording failure of PDF {pdf_url}: {e}")
+
+    def get_failed_pdfs(self, years: list = None) -> list:
+        """
+        URLs of stored PDFs still without text after fewer than MAX_PDF_ATTEMPTS failures,
+        only those of penalties in `years` if given. PDFs with only migrated page-0 text
+        count as without text, so they are extracted again page by page.
+        """
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT failure.pdf_url FROM pdf_failures failure
+                JOIN penalties_pdfs pdf ON pdf.pdf_url = failure.pdf_url
+                WHERE failure.attempts < ?
+                AND NOT EXISTS (SELECT 1 FROM pdf_pages page WHERE page.pdf_url = failure.pdf_url AND page.page_no > 0)
+                AND (? IS NULL OR EXISTS (
+                    SELECT 1 FROM penalty_pdf link
+                    JOIN penalties ON penalties.id = link.penalty_id
+                    WHERE link.pdf_url = failure.pdf_url
+                    AND CAST(substr(penalties.date, 1, 4) AS INTEGER) IN (SELECT value FROM json_each(?))
+                ))
+            """, (MAX_PDF_ATTEMPTS, None if years is None else 1, json.dumps(years)))
+            return [row[0] for row in cursor.fetchall()]
+            
+        except Exception as e:
+            print(f"Error getting failed PDFs: {e}")
+            return []
+
+    def get_pdf_source(self, pdf_url):
+        """Get the validators and content hash of the last successful download of a PDF URL."""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT etag, last_modified, sha256 FROM pdf_sources 
+                WHERE pdf_url = ?
+            """, (pdf_url,))
+            
+            row = cursor.fetchone()
+            if row:
+                return {'etag': row[0], 'last_modified': row[1], 'sha256': row[2]}
+            
+        except Exception as e:
+            print(f"Error getting PDF source for {pdf_url}: {e}")
+        return None
+
+    def get_cached_pdf_hashes(self) -> set:
+        """Get the content hashes of every PDF whose text is in the cache."""
+        try:
+            conn = self.get_db_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT sha256 FROM pdf_cache")
+            return {row[0] for row in cursor.fetchall()}
+            
+        except Exception as e:
+            print(f"Error getting cached PDF hashes: {e}")
+            return set()
+
+    def cache_pdf(self, pdf_url, source, pdf_text):
+        """
+        Record a downloaded PDF in the content-addressed cache and return its text. When no
+        text is given (the bytes were unchanged or already seen) it is read from the cache.
+        """
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            # Store penalty
+            if pdf_text is None:
+                cursor.execute("SELECT pdf_text FROM pdf_cache WHERE sha256 = ?", (source['sha256'],))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                pdf_text = database.unpack_text(row[0])
+            else:
+                cursor.execute("""
+                    INSERT OR IGNORE INTO pdf_cache (sha256, pdf_text, created_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                """, (source['sha256'], database.pack_text(pdf_text, self.compress_text)))
+            
+            # Only URLs whose text is cached are revalidated instead of downloaded
             cursor.execute("""
-                INSERT OR IGNORE INTO penalties (
-                    id, date, revision_date, name, aggregate_penalties_settlements_findings,
-                    penalties_settlements_usd_total, created_at
-                ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (unique_id, date, revision_date, name, penalties, amount))
+                INSERT OR REPLACE INTO pdf_sources (pdf_url, sha256, etag, last_modified, fetched_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (pdf_url, source['sha256'], source['etag'], source['last_modified']))
             
-            # Store or update PDF with the penalty link
-            self.store_pdf(pdf_url, pdf_text, unique_id)
+            conn.commit()
             
+        except Exception as e:
+            print(f"Error caching PDF {pdf_url}: {e}")
+        return pdf_text
+
+    def extract_pdf_text(self, pdf_content):
+        return extract_pdf_text(pdf_content, self.extract_backends)
+
+    def _insert_entries(self, cursor, inserts):
+        """
+        Upsert new penalties with their PDFs, given as (pdf_url, pdf_text, penalties), with one
+        executemany per table. PDFs that already have pages keep them unless their text changed,
+        and PDFs given without penalties (retried or revalidated ones) only get their pages.
+        """
+        rows = [(pdf_url, entry) for pdf_url, _, penalties in inserts for entry in penalties]
+        if rows:
+            self._upsert_penalties(cursor, rows)
+        
+        # Store the PDFs and link the penalties to them
+        cursor.executemany("INSERT OR IGNORE INTO penalties_pdfs (pdf_url, created_at) VALUES (?, CURRENT_TIMESTAMP)",
+                           [(pdf_url,) for pdf_url, _, _ in inserts])
+        cursor.executemany("INSERT OR IGNORE INTO penalty_pdf (penalty_id, pdf_url) VALUES (?, ?)",
+                           [(entry['id'], pdf_url) for pdf_url, entry in rows])
+        
+        # Store the pages of PDFs that don't have them yet, with their offsets in the whole text
+        texts = {pdf_url: pdf_text for pdf_url, pdf_text, _ in inserts if pdf_text}
+        # PDFs with text are no longer failed, whether or not their pages were stored before
+        cursor.execute("DELETE FROM pdf_failures WHERE pdf_url IN (SELECT value FROM json_each(?))",
+                       (json.dumps(list(texts)),))
+        if self.checkpoint:
+            self.checkpoint.pdfs_stored(cursor, list(texts))
+        cursor.execute("""
+            SELECT pdf_url, page_no, unpack_text(text) FROM pdf_pages
+            WHERE pdf_url IN (SELECT value FROM json_each(?))
+            ORDER BY pdf_url, page_no
+        """, (json.dumps(list(texts)),))
+        stored = {}
+        for pdf_url, page_no, page_text in cursor.fetchall():
+            # Page 0 holds text from before page breaks were kept, which is always replaced
+            stored.setdefault(pdf_url, []).append(page_text if page_no else None)
+        replaced = []
+        for pdf_url, pages in stored.items():
+            if None in pages or "\f".join(pages) != texts[pdf_url]:
+                replaced.append(pdf_url)
+            else:
+                del texts[pdf_url]
+        if replaced:
+            # The PDF at this URL was replaced; drop its old pages and their index rows
+            replaced_json = json.dumps(replaced)
+            database.delete_page_index(cursor, "SELECT id FROM pdf_pages WHERE pdf_url IN (SELECT value FROM json_each(?))",
+                                       (replaced_json,))
+            cursor.execute("DELETE FROM pdf_pages WHERE pdf_url IN (SELECT value FROM json_each(?))", (replaced_json,))
+            self.metrics.add('pdfs_replaced', len(replaced))
+        
+        pages = []
+        for pdf_url, pdf_text in texts.items():
+            offset = 0
+            for page_no, page_text in enumerate(pdf_text.split("\f"), start=1):
+                pages.append((pdf_url, page_no, offset, database.pack_text(page_text, self.compress_text)))
+                offset += len(page_text) + 1
+        cursor.executemany("INSERT INTO pdf_pages (pdf_url, page_no, char_offset, text) VALUES (?, ?, ?, ?)", pages)
+        
+        # Index the pages for full-text search
+        database.index_pages(cursor, "SELECT id FROM pdf_pages WHERE pdf_url IN (SELECT value FROM json_each(?))",
+                             (json.dumps(list(texts)),))
+
+    def _upsert_penalties(self, cursor, rows):
+        """Upsert penalties given as (pdf_url, entry) and index their names."""
+        cursor.executemany("""
+            INSERT INTO penalties (
+                id, date, revision_date, name, aggregate_penalties_settlements_findings,
+                penalties_settlements_usd_total, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                revision_date = excluded.revision_date,
+                aggregate_penalties_settlements_findings = excluded.aggregate_penalties_settlements_findings,
+                penalties_settlements_usd_total = excluded.penalties_settlements_usd_total
+        """, [
+            (entry['id'], entry['date'], entry['revision_date'], entry['name'], entry['penalties'], entry['amount'])
+            for _, entry in rows
+        ])
+        
+        # Index the names for full-text search, replacing any existing rows for these IDs
+        cursor.execute("DELETE FROM penalties_fts WHERE id IN (SELECT value FROM json_each(?))",
+                       (json.dumps([entry['id'] for _, entry in rows]),))
+        cursor.executemany("INSERT INTO penalties_fts (id, name) VALUES (?, ?)",
+                           [(entry['id'], entry['name']) for _, entry in rows])
+
+    def _delete_penalties(self, cursor, penalty_ids):
+        ids_json = json.dumps(list(penalty_ids))
+        
+        # First, get the PDFs linked to these entries
+        cursor.execute("""
+            SELECT DISTINCT pdf_url FROM penalty_pdf 
+            WHERE penalty_id IN (SELECT value FROM json_each(?))
+        """, (ids_json,))
+        pdf_urls = [row[0] for row in cursor.fetchall()]
+        
+        # Unlink the entries from their PDFs and the full-text index, then remove them
+        cursor.execute("DELETE FROM penalty_pdf WHERE penalty_id IN (SELECT value FROM json_each(?))", (ids_json,))
+        cursor.execute("DELETE FROM penalties_fts WHERE id IN (SELECT value FROM json_each(?))", (ids_json,))
+        cursor.execute("DELETE FROM penalties WHERE id IN (SELECT value FROM json_each(?))", (ids_json,))
+        
+        # Remove PDF entries that no longer have any linked penalties
+        cursor.execute("""
+            SELECT value FROM json_each(?) 
+            WHERE NOT EXISTS (SELECT 1 FROM penalty_pdf WHERE penalty_pdf.pdf_url = value)
+        """, (json.dumps(pdf_urls),))
+        orphans_json = json.dumps([row[0] for row in cursor.fetchall()])
+        database.delete_page_index(cursor, "SELECT id FROM pdf_pages WHERE pdf_url IN (SELECT value FROM json_each(?))",
+                                   (orphans_json,))
+        cursor.execute("DELETE FROM pdf_pages WHERE pdf_url IN (SELECT value FROM json_each(?))", (orphans_json,))
+        cursor.execute("DELETE FROM penalties_pdfs WHERE pdf_url IN (SELECT value FROM json_each(?))", (orphans_json,))
+        cursor.execute("DELETE FROM pdf_failures WHERE pdf_url IN (SELECT value FROM json_each(?))", (orphans_json,))
+
+    def store_penalty(self, unique_id, date, revision_date, name, penalties, amount, pdf_text, pdf_url):
+        """Store penalty information and link it to PDF. Prefer store_entries for more than one."""
+        self.store_entries([(pdf_url, pdf_text, [{
+            'id': unique_id, 'date': date, 'revision_date': revision_date,
+            'name': name, 'penalties': penalties, 'amount': amount
+        }])])
+
+    def store_entries(self, inserts: list) -> bool:
+        """
+        Store a batch of new penalties with their (pdf_url, pdf_text, penalties) in one
+        transaction. Returns whether it was committed.
+        """
+        conn = self.get_db_connection()
+        try:
+            self._insert_entries(conn.cursor(), inserts)
             conn.commit()
-            print(f"Stored: {date} - {name} - ${amount:,.2f}")
+            self.report_stored(inserts)
+            return True
             
         except Exception as e:
-            print(f"Error storing penalty: {e}")
+            conn.rollback()
+            print(f"Error storing penalties: {e}")
+            return False
+
+    def report_stored(self, inserts: list):
+        for _, _, penalties in inserts:
+            for entry in penalties:
+                print(f"Stored: {entry['date']} - {entry['name']} - ${entry['amount']:,.2f}")
+
+    def apply_year_changes(self, year: int, inserts: list, updates: list, removed_ids: list) -> bool:
+        """
+        Apply one year's diff in a single transaction: delete penalties that are no longer
+        listed, update changed ones and insert new ones with their (pdf_url, pdf_text, penalties).
+        Returns whether it was committed.
+        """
+        conn = self.get_db_connection()
+        try:
+            start = time.perf_counter()
+            cursor = conn.cursor()
+            
+            if removed_ids:
+                self._delete_penalties(cursor, removed_ids)
+            
+            cursor.executemany("""
+                UPDATE penalties 
+                SET revision_date = ?,
+                    aggregate_penalties_settlements_findings = ?,
+                    penalties_settlements_usd_total = ?
+                WHERE id = ?
+            """, [(entry['revision_date'], entry['penalties'], entry['amount'], entry['id']) for entry in updates])
+            
+            self._insert_entries(cursor, inserts)
+            if self.checkpoint:
+                self.checkpoint.year_stored(cursor, year)
+            
+            conn.commit()
+            self.metrics.record('commit', time.perf_counter() - start, year)
+            self.metrics.add('penalties_stored', sum(len(p) for _, _, p in inserts), year)
+            self.metrics.emit_year(year)
+            self.report_stored(inserts)
+            print(f"Year {year}: Stored {sum(len(p) for _, _, p in inserts)} new, "
+                  f"{len(updates)} changed and removed {len(removed_ids)} entries")
+            return True
+            
+        except Exception as e:
+            conn.rollback()
+            self.metrics.add('commit_failures', year=year)
+            print(f"Error applying changes for year {year}: {e}")
+            return False
+
+    def entry_changed(self, web_entry: dict, db_entry: dict) -> bool:
+        """Check whether a listed entry differs from the stored entry with the same ID."""
+        revision_date = web_entry['revision_date'].isoformat() if web_entry['revision_date'] else None
+        return (revision_date != db_entry['revision_date'] or
+                web_entry['penalties'] != db_entry['penalties'] or
+                web_entry['amount'] != db_entry['amount'])
 
     def entry_exists(self, unique_id):
         """Check if an entry already exists with the same unique ID"""
@@ -310,10 +1102,13 @@ class OFACPenaltyScraper:
                     p.penalties_settlements_usd_total,
                     p.created_at,
                     pdf.pdf_url,
-                    pdf.pdf_text,
-                    pdf.linked_penalties
+                    (SELECT unpack_text(text) FROM pdf_pages page WHERE page.pdf_url = pdf.pdf_url
+                     ORDER BY page.page_no LIMIT 1) AS pdf_text,
+                    (SELECT GROUP_CONCAT(linked.penalty_id) FROM penalty_pdf linked
+                     WHERE linked.pdf_url = pdf.pdf_url) AS linked_penalties
                 FROM penalties p
-                LEFT JOIN penalties_pdfs pdf ON pdf.linked_penalties LIKE '%' || p.id || '%'
+                LEFT JOIN penalty_pdf link ON link.penalty_id = p.id
+                LEFT JOIN penalties_pdfs pdf ON pdf.pdf_url = link.pdf_url
                 ORDER BY p.date DESC
                 LIMIT ?
             """, (x,))
@@ -346,23 +1141,21 @@ class OFACPenaltyScraper:
 
     def extract_number(self, text):
         """Extracts the first numeric value from a given text."""
-        # Use regex to find numbers (including commas and decimals)
-        match = re.search(r'[\d,]+(?:\.\d+)?', text)
-        if match:
-            # Remove commas for conversion to float
-            return float(match.group(0).replace(',', ''))
-        return 0  # Return 0 if no number is found
+        return listing_parser.extract_number(text)
 
     def extract_dates(self, date_str):
         """Extracts the main date and revision date from the date string."""
-        # Split the date string to separate the revision date if it exists
-        parts = date_str.split(' (Revised ')
-        main_date_str = parts[0].strip()  # The main date
-        revision_date_str = parts[1].replace(')', '').strip() if len(parts) > 1 else None  # The revision date, if present
-        return main_date_str, revision_date_str
+        return listing_parser.extract_dates(date_str)
+
+    def year_bounds(self, year: int) -> tuple:
+        """First day of the year and of the next one, for index-friendly date range filters."""
+        return (f"{year}-01-01", f"{year + 1}-01-01")
 
     def remove_entries_for_year(self, year: int):
-        """Remove all entries for a specific year from both penalties and penalties_pdfs tables."""
+        """
+        Remove all entries for a specific year from both penalties and penalties_pdfs tables,
+        and forget its listing page's validators so the next scrape stores the year again.
+        """
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
@@ -370,43 +1163,20 @@ class OFACPenaltyScraper:
             # First, get all IDs for the specified year
             cursor.execute("""
                 SELECT id FROM penalties 
-                WHERE strftime('%Y', date) = ?
-            """, (str(year),))
+                WHERE date >= ? AND date < ?
+            """, self.year_bounds(year))
             
             year_ids = [row[0] for row in cursor.fetchall()]
             
-            if not year_ids:
-                return
-                
-            # Remove entries from penalties table
-            cursor.execute("""
-                DELETE FROM penalties 
-                WHERE strftime('%Y', date) = ?
-            """, (str(year),))
-            
-            # Update or remove entries from penalties_pdfs table
-            for pdf_id in year_ids:
-                cursor.execute("""
-                    UPDATE penalties_pdfs 
-                    SET linked_penalties = REPLACE(linked_penalties, ?, '')
-                    WHERE linked_penalties LIKE ?
-                """, (pdf_id + ',', '%' + pdf_id + '%'))
-                
-                # Clean up any trailing or double commas
-                cursor.execute("""
-                    UPDATE penalties_pdfs 
-                    SET linked_penalties = TRIM(REPLACE(linked_penalties, ',,', ','), ',')
-                    WHERE linked_penalties LIKE ',%' OR linked_penalties LIKE '%,'
-                """)
-                
-                # Remove PDF entries that no longer have any linked penalties
-                cursor.execute("""
-                    DELETE FROM penalties_pdfs 
-                    WHERE linked_penalties IS NULL OR linked_penalties = ''
-                """)
+            if year_ids:
+                self._delete_penalties(cursor, year_ids)
+            # The year may be listed on its own page or, as the current year, on the base page
+            cursor.execute("DELETE FROM listing_pages WHERE url IN (?, ?)",
+                           (self.listing_url(year, datetime.now().year), self.listing_url(year, None)))
             
             conn.commit()
-            print(f"Removed existing entries for year {year}")
+            if year_ids:
+                print(f"Removed existing entries for year {year}")
             
         except Exception as e:
             print(f"Error removing entries for year {year}: {e}")
@@ -420,8 +1190,8 @@ class OFACPenaltyScraper:
             
             cursor.execute("""
                 SELECT COUNT(*) FROM penalties 
-                WHERE strftime('%Y', date) = ?
-            """, (str(year),))
+                WHERE date >= ? AND date < ?
+            """, self.year_bounds(year))
             
             count = cursor.fetchone()[0]
             return count
@@ -438,14 +1208,15 @@ class OFACPenaltyScraper:
             
             cursor.execute("""
                 SELECT 
+                    id,
                     date,
                     revision_date,
                     name,
                     aggregate_penalties_settlements_findings as penalties,
                     penalties_settlements_usd_total as amount
                 FROM penalties 
-                WHERE strftime('%Y', date) = ?
-            """, (str(year),))
+                WHERE date >= ? AND date < ?
+            """, self.year_bounds(year))
             
             columns = [col[0] for col in cursor.description]
             return [dict(zip(columns, row)) for row in cursor.fetchall()]
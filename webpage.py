@@ -1,19 +1,27 @@
 import streamlit as st
 import sqlite3
-from datetime import datetime, date, timedelta
-import pandas as pd
+from datetime import datetime, date
 import re
+import threading
 from typing import List, Tuple
-import webbrowser
-from scraper import OFACPenaltyScraper
+from bisect import bisect_right
+from functools import lru_cache
+from database import connect, setup_database, unpack_text
+from refresh_worker import get_refresh_status, refresh_due, start_background_refresh
 import json
-import os
 
 class SearchType:
     EXACT = "Exact match"
     AND = "Contains all words"
     OR = "Contains any word"
 
+class SortOrder:
+    NEWEST = "Newest first"
+    RELEVANCE = "Most relevant"
+
+# A match in the penalty name counts this many times as much as one in the PDF text
+NAME_WEIGHT = 10.0
+
 def setup_page():
     st.set_page_config(
         page_title="OFAC Search",
@@ -32,18 +40,95 @@ def setup_page():
         </style>
     """, unsafe_allow_html=True)
 
+@st.cache_resource
+def database_connections() -> threading.local:
+    """
+    Set up the database once per server, and hold a read-only connection per session thread.
+    Threads don't share a connection: one thread's query running the unpack_text function
+    waits for the GIL, which another thread can hold while waiting on that connection
+    """
+    conn = connect()
+    setup_database(conn)
+    conn.close()
+    return threading.local()
+
 def connect_db() -> sqlite3.Connection:
-    return sqlite3.connect("ofac_penalties.db")
+    """
+    This thread's read-only connection. It sees the last committed data while a refresh
+    writes, and can never block the refresh
+    """
+    connections = database_connections()
+    if not hasattr(connections, 'conn'):
+        connections.conn = connect(read_only=True)
+    return connections.conn
 
-def search_penalties(
+def get_db_version(conn: sqlite3.Connection) -> int:
+    """Changes whenever another connection, such as the scraper's, commits to the database"""
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+def fts_phrase(term: str):
+    """Quote a search term as an FTS5 prefix phrase, or None if it has no searchable words"""
+    if not re.search(r'\w', term):
+        return None
+    return '"' + term.replace('"', '""') + '"*'
+
+def like_pattern(text: str) -> str:
+    """LIKE pattern (with ESCAPE '\\') matching text anywhere in a value"""
+    return "%" + text.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def term_condition(term: str) -> Tuple[str, List[str]]:
+    """SQL condition matching a term in the penalty name or any page of its PDF"""
+    phrase = fts_phrase(term)
+    if phrase is None:
+        # Punctuation-only terms are invisible to the full-text index
+        return (
+            "(LOWER(p.name) LIKE ? ESCAPE '\\' OR EXISTS (SELECT 1 FROM pdf_pages page"
+            " WHERE page.pdf_url = pdf.pdf_url AND LOWER(unpack_text(page.text)) LIKE ? ESCAPE '\\'))",
+            [like_pattern(term), like_pattern(term)]
+        )
+    # The index drops punctuation, so "c++" would match any word starting with "c". It only
+    # finds candidates for words containing punctuation, which must then appear literally
+    literals = [like_pattern(word) for word in term.split() if re.search(r'[\W_]', word)]
+    name_check = " AND LOWER(p.name) LIKE ? ESCAPE '\\'" * len(literals)
+    page_check = " AND LOWER(unpack_text(text)) LIKE ? ESCAPE '\\'" * len(literals)
+    return (
+        f"((p.id IN (SELECT id FROM penalties_fts WHERE penalties_fts MATCH ?){name_check})"
+        " OR pdf.pdf_url IN (SELECT pdf_url FROM pdf_pages"
+        f" WHERE id IN (SELECT rowid FROM pdf_pages_fts WHERE pdf_pages_fts MATCH ?){page_check}))",
+        [phrase, *literals, phrase, *literals]
+    )
+
+def page_match_expression(search_text: str, search_type: str):
+    """
+    FTS5 expression selecting the PDF pages worth scanning for excerpts, or None if
+    the search can't be narrowed down by the index
+    """
+    if search_type == SearchType.EXACT:
+        return fts_phrase(search_text)
+    
+    phrases = [fts_phrase(word) for word in search_text.lower().split()]
+    if search_type == SearchType.AND:
+        # Pages must contain every word; those the index can't see are checked when scanning
+        phrases = [phrase for phrase in phrases if phrase]
+        return " AND ".join(phrases) or None
+    if None in phrases or not phrases:
+        return None
+    return " OR ".join(phrases)
+
+def rank_match_expression(search_text: str, search_type: str):
+    """FTS5 expression results are scored against: the exact phrase, or any of the words"""
+    if search_type == SearchType.EXACT:
+        return fts_phrase(search_text)
+    phrases = [phrase for phrase in (fts_phrase(word) for word in search_text.lower().split()) if phrase]
+    return " OR ".join(phrases) or None
+
+def build_search_query(
     search_text: str,
     search_type: str,
     start_date: date,
-    end_date: date,
-    conn: sqlite3.Connection
-) -> List[Tuple]:
-    cursor = conn.cursor()
-    
+    end_date: date
+) -> Tuple[str, List]:
+    """Matching result rows (without PDF text) as a SELECT, and its parameters"""
     # Base query joining penalties and penalties_pdfs tables
     query = """
         SELECT DISTINCT
@@ -52,196 +137,313 @@ def search_penalties(
             p.aggregate_penalties_settlements_findings, 
             p.penalties_settlements_usd_total,
             p.revision_date,
-            pdf.pdf_url,
-            pdf.pdf_text
+            pdf.pdf_url
         FROM penalties p
-        JOIN penalties_pdfs pdf ON p.id IN (
-            SELECT value 
-            FROM json_each('["' || REPLACE(pdf.linked_penalties, ',', '","') || '"]')
-        )
+        JOIN penalty_pdf link ON link.penalty_id = p.id
+        JOIN penalties_pdfs pdf ON pdf.pdf_url = link.pdf_url
         WHERE p.date >= ? AND p.date <= ?
     """
     
     params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
     
-    # Add search conditions based on search type
+    # Add search conditions based on search type, answered by the full-text indexes
     if search_text:        
         if search_type == SearchType.EXACT:
-            query += " AND (LOWER(p.name) LIKE ? OR LOWER(pdf.pdf_text) LIKE ?)"
-            params.extend([f"%{search_text.lower()}%", f"%{search_text.lower()}%"])
+            condition, condition_params = term_condition(search_text)
+            query += f" AND {condition}"
+            params.extend(condition_params)
         
         elif search_type == SearchType.AND:
             words = search_text.lower().split()
             for word in words:
-                query += " AND (LOWER(p.name) LIKE ? OR LOWER(pdf.pdf_text) LIKE ?)"
-                params.extend([f"%{word}%", f"%{word}%"])
+                condition, condition_params = term_condition(word)
+                query += f" AND {condition}"
+                params.extend(condition_params)
         
         elif search_type == SearchType.OR:
             words = search_text.lower().split()
             or_conditions = []
             for word in words:
-                or_conditions.append("(LOWER(p.name) LIKE ? OR LOWER(pdf.pdf_text) LIKE ?)")
-                params.extend([f"%{word}%", f"%{word}%"])
+                condition, condition_params = term_condition(word)
+                or_conditions.append(condition)
+                params.extend(condition_params)
             query += f" AND ({' OR '.join(or_conditions)})"
     
-    # Add ORDER BY clause to sort by date in descending order
-    query += " ORDER BY p.date DESC"
+    return query, params
 
+def search_penalties(
+    search_text: str,
+    search_type: str,
+    start_date: date,
+    end_date: date,
+    conn: sqlite3.Connection,
+    limit: int = -1,
+    offset: int = 0,
+    sort_order: str = SortOrder.NEWEST
+) -> List[Tuple]:
+    """
+    One page of matching results, each with the number of its PDF pages that match.
+    Newest first, or by BM25 relevance with name matches weighted by NAME_WEIGHT.
+    PDF pages are loaded separately with get_matching_pages.
+    """
+    query, params = build_search_query(search_text, search_type, start_date, end_date)
+    
+    expression = rank_match_expression(search_text, search_type) if search_text else None
+    if expression:
+        # bm25() is negative, lower being more relevant. A PDF scores the sum over its
+        # matching pages. The scores are materialized so bm25() runs inside the MATCH query
+        query = f"""
+            WITH page_scores AS MATERIALIZED (
+                SELECT page.pdf_url, bm25(pdf_pages_fts) AS score
+                FROM pdf_pages_fts JOIN pdf_pages page ON page.id = pdf_pages_fts.rowid
+                WHERE pdf_pages_fts MATCH ?
+            ),
+            name_scores AS MATERIALIZED (
+                SELECT name, bm25(penalties_fts, 0.0, 1.0) AS score
+                FROM penalties_fts WHERE penalties_fts MATCH ?
+            )
+            SELECT results.*, COALESCE(pages.hits, 0) AS hits
+            FROM ({query}) results
+            LEFT JOIN (
+                SELECT pdf_url, SUM(score) AS score, COUNT(*) AS hits FROM page_scores GROUP BY pdf_url
+            ) pages ON pages.pdf_url = results.pdf_url
+            LEFT JOIN (
+                SELECT name, MIN(score) AS score FROM name_scores GROUP BY name
+            ) names ON names.name = results.name
+        """
+        params = [expression, expression] + params
+    else:
+        query = f"SELECT results.*, 0 AS hits FROM ({query}) results"
+    
+    # Sort by date in descending order; name and URL keep pages stable within a day
+    order = "results.date DESC, results.name, results.pdf_url"
+    if sort_order == SortOrder.RELEVANCE and expression:
+        order = f"{NAME_WEIGHT} * COALESCE(names.score, 0) + COALESCE(pages.score, 0), {order}"
+    query += f" ORDER BY {order} LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    cursor = conn.cursor()
     cursor.execute(query, params)
     return cursor.fetchall()
 
-def find_excerpts(text: str, search_text: str, search_type: str) -> List[Tuple[str, int]]:
-    """Find all occurrences of search text in the document"""
-    if not text or not search_text:
-        return []
+def count_penalties(
+    search_text: str,
+    search_type: str,
+    start_date: date,
+    end_date: date,
+    conn: sqlite3.Connection
+) -> int:
+    """Total number of results search_penalties can page through"""
+    query, params = build_search_query(search_text, search_type, start_date, end_date)
     
-    # Split text into pages
-    pages = text.split("\f")
-    excerpts = []
-    seen_excerpts = set()  # Track unique excerpts
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM ({query})", params)
+    return cursor.fetchone()[0]
+
+def get_matching_pages(
+    pdf_urls: List[str],
+    search_text: str,
+    search_type: str,
+    conn: sqlite3.Connection
+) -> dict:
+    """(page_no, text) of the pages of the given PDFs that match the search, keyed by URL"""
+    if not search_text:
+        return {}
     
-    words = search_text.lower().split()
+    urls_json = json.dumps(list(pdf_urls))
+    expression = page_match_expression(search_text, search_type)
+    cursor = conn.cursor()
+    if expression:
+        cursor.execute("""
+            SELECT pdf_url, page_no, text FROM pdf_pages
+            WHERE pdf_url IN (SELECT value FROM json_each(?))
+            AND id IN (SELECT rowid FROM pdf_pages_fts WHERE pdf_pages_fts MATCH ?)
+            ORDER BY pdf_url, page_no
+        """, (urls_json, expression))
+    else:
+        cursor.execute("""
+            SELECT pdf_url, page_no, text FROM pdf_pages
+            WHERE pdf_url IN (SELECT value FROM json_each(?))
+            ORDER BY pdf_url, page_no
+        """, (urls_json,))
     
-    for page_num, page in enumerate(pages, 1):
-        page_lower = page.lower()
-        
-        if search_type == SearchType.EXACT:
-            # Find all occurrences of the exact phrase
-            start = 0
-            while True:
-                index = page_lower.find(search_text.lower(), start)
-                if index == -1:
-                    break
-                    
-                # Get context for this occurrence
-                excerpt = extract_context(page, page[index:index+len(search_text)], index)
-                
-                # Only add if this exact excerpt hasn't been seen
-                excerpt_key = (excerpt, page_num)
-                if excerpt_key not in seen_excerpts:
-                    seen_excerpts.add(excerpt_key)
-                    excerpts.append((excerpt, page_num))
-                
-                start = index + len(search_text)  # Move past the current match
-                
-        elif search_type == SearchType.AND:
-            # Find occurrences where all words appear
-            if all(word in page_lower for word in words):
-                for word in words:
-                    start = 0
-                    while True:
-                        index = page_lower.find(word, start)
-                        if index == -1:
-                            break
-                            
-                        excerpt = extract_context(page, page[index:index+len(word)], index)
-                        excerpt_key = (excerpt, page_num)
-                        if excerpt_key not in seen_excerpts:
-                            seen_excerpts.add(excerpt_key)
-                            excerpts.append((excerpt, page_num))
-                            
-                        start = index + len(word)
-                
-        elif search_type == SearchType.OR:
-            # Find occurrences of any word
-            for word in words:
-                start = 0
-                while True:
-                    index = page_lower.find(word, start)
-                    if index == -1:
-                        break
-                        
-                    excerpt = extract_context(page, page[index:index+len(word)], index)
-                    excerpt_key = (excerpt, page_num)
-                    if excerpt_key not in seen_excerpts:
-                        seen_excerpts.add(excerpt_key)
-                        excerpts.append((excerpt, page_num))
-                        
-                    start = index + len(word)
+    pages = {}
+    for pdf_url, page_no, text in cursor.fetchall():
+        pages.setdefault(pdf_url, []).append((page_no, unpack_text(text)))
+    return pages
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def cached_search_penalties(
+    search_text: str,
+    search_type: str,
+    start_date: date,
+    end_date: date,
+    page_number: int,
+    results_per_page: int,
+    sort_order: str,
+    db_version: int
+) -> List[Tuple]:
+    """One page of search_penalties, cached per query until the database changes"""
+    return search_penalties(
+        search_text, search_type, start_date, end_date, connect_db(),
+        limit=results_per_page, offset=(page_number - 1) * results_per_page,
+        sort_order=sort_order
+    )
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def cached_count_penalties(
+    search_text: str,
+    search_type: str,
+    start_date: date,
+    end_date: date,
+    db_version: int
+) -> int:
+    """count_penalties, cached per query until the database changes"""
+    return count_penalties(search_text, search_type, start_date, end_date, connect_db())
+
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def cached_matching_pages(
+    pdf_urls: Tuple[str, ...],
+    search_text: str,
+    search_type: str,
+    db_version: int
+) -> dict:
+    """get_matching_pages for one page of results, cached so reruns don't decompress them again"""
+    return get_matching_pages(pdf_urls, search_text, search_type, connect_db())
+
+@lru_cache(maxsize=256)
+def search_pattern(search_text: str, search_type: str) -> Tuple[re.Pattern, Tuple[str, ...]]:
+    """One regex matching every lowercased search term, and the terms themselves"""
+    if search_type == SearchType.EXACT:
+        terms = (search_text.lower(),) if search_text.strip() else ()
+        # The full-text index ignores how the words are spaced, so line breaks match too
+        return re.compile(r"\s+".join(re.escape(word) for word in search_text.lower().split())), terms
     
-    return excerpts
+    # Longest first, so a term that contains another wins the alternation
+    terms = tuple(sorted(set(search_text.lower().split()), key=len, reverse=True))
+    return re.compile("|".join(re.escape(term) for term in terms)), terms
 
-def extract_context(text: str, search_text: str, index: int, context_chars: int = 100) -> str:
-    """Extract text around the search term with context"""
+def find_excerpt_windows(
+    text: str,
+    search_text: str,
+    search_type: str,
+    context_chars: int = 100
+) -> List[Tuple[int, int, int, bool, bool]]:
+    """
+    Locate every match of the search terms in a single pass over the document and merge
+    their overlapping context windows. Returns (page_num, start, end, clipped_start,
+    clipped_end) windows over `text`; format_excerpt turns one into display text.
+    """
     if not text or not search_text:
-        return ""
+        return []
+    
+    pattern, terms = search_pattern(search_text, search_type)
+    if not terms:
+        return []
+    
+    # Pages are separated by form feeds
+    page_breaks = [match.start() for match in re.finditer("\f", text)]
+    
+    # Matching a lowercased copy is much faster than a case-insensitive regex, as long
+    # as lowercasing keeps the offsets the same
+    haystack = text.lower()
+    if len(haystack) != len(text):
+        haystack, pattern = text, re.compile(pattern.pattern, re.IGNORECASE)
     
-    start = max(0, index - context_chars)
-    end = min(len(text), index + len(search_text) + context_chars)
+    # Group match offsets by page
+    page_matches = {}
+    for match in pattern.finditer(haystack):
+        page_index = bisect_right(page_breaks, match.start())
+        page_matches.setdefault(page_index, []).append(match)
     
+    windows = []
+    for page_index, matches in page_matches.items():
+        # For "all words", only pages containing every word count
+        if search_type == SearchType.AND:
+            found = {term for match in matches for term in terms if term in match.group(0).lower()}
+            if len(found) < len(terms):
+                continue
+        
+        page_start = page_breaks[page_index - 1] + 1 if page_index else 0
+        page_end = page_breaks[page_index] if page_index < len(page_breaks) else len(text)
+        
+        merged = []
+        for match in matches:
+            start = max(page_start, match.start() - context_chars)
+            end = min(page_end, match.end() + context_chars)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        
+        windows.extend(
+            (page_index + 1, start, end, start > page_start, end < page_end)
+            for start, end in merged
+        )
+    
+    return windows
+
+def format_excerpt(text: str, window: Tuple[int, int, int, bool, bool]) -> str:
+    """Excerpt text for a window from find_excerpt_windows"""
+    _, start, end, clipped_start, clipped_end = window
     excerpt = text[start:end]
-    if start > 0:
+    if clipped_start:
         excerpt = f"...{excerpt}"
-    if end < len(text):
+    if clipped_end:
         excerpt = f"{excerpt}..."
-        
     return excerpt.strip()
 
-def check_last_update():
-    """Check when the last update was performed"""
-    try:
-        if os.path.exists('last_update.json'):
-            with open('last_update.json', 'r') as f:
-                data = json.load(f)
-                last_update = datetime.fromisoformat(data['last_update'])
-                return last_update
-        return None
-    except Exception as e:
-        print(f"Error reading last update time: {e}")
-        return None
+def find_excerpts(text: str, search_text: str, search_type: str, limit: int = None) -> List[Tuple[str, int]]:
+    """Find occurrences of search text in the document, as (excerpt, page_num) pairs"""
+    windows = find_excerpt_windows(text, search_text, search_type)
+    return [(format_excerpt(text, window), window[0]) for window in windows[:limit]]
+
+def find_page_windows(
+    pages: List[Tuple[int, str]],
+    search_text: str,
+    search_type: str
+) -> List[Tuple[int, int, int, bool, bool]]:
+    """find_excerpt_windows over each stored page, numbered with the page's own page_no"""
+    windows = []
+    for page_no, text in pages:
+        windows.extend(
+            (page_no,) + window[1:]
+            for window in find_excerpt_windows(text, search_text, search_type)
+        )
+    return windows
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def cached_page_windows(
+    pdf_url: str,
+    search_text: str,
+    search_type: str,
+    db_version: int,
+    _pages: List[Tuple[int, str]]
+) -> List[Tuple[int, int, int, bool, bool]]:
+    """find_page_windows, memoized per PDF and query until the database changes"""
+    return find_page_windows(_pages, search_text, search_type)
 
-def save_last_update():
-    """Save the current time as the last update time"""
+def check_for_updates(manual_update: bool = False) -> bool:
+    """
+    Start a background check for new resolutions if 24 hours have passed since the last
+    one (or right away for a manual update) and return without waiting for it. Returns
+    whether a check is running.
+    """
     try:
-        with open('last_update.json', 'w') as f:
-            json.dump({'last_update': datetime.now().isoformat()}, f)
+        # Only open a writable connection when the shared read-only one says a refresh is due
+        if refresh_due(get_refresh_status(connect_db()), manual_update):
+            start_background_refresh(force=manual_update)
+        return get_refresh_status(connect_db())['state'] == 'running'
     except Exception as e:
-        print(f"Error saving last update time: {e}")
-
-def check_for_updates(manual_update: bool = False):
-    """Check for updates if 24 hours have passed since last check"""
-    last_update = check_last_update()
-    current_time = datetime.now()
-    
-    if last_update is None or (current_time - last_update) > timedelta(hours=24) or (manual_update == True):
-        current_year = current_time.year
-        
-        with st.spinner(f"Checking for new resolutions from {current_year}..."):
-            # Create a placeholder for dynamic status updates
-            status_placeholder = st.empty()
-            
-            # Initialize counters
-            initial_count = get_penalty_count()
-            
-            # Run the scraper for the current year
-            scraper = OFACPenaltyScraper()
-            scraper.scrape_and_store(current_year, current_year)
-            
-            # Get the new count
-            final_count = get_penalty_count()
-            
-            # Calculate new entries
-            new_entries = final_count - initial_count
-            
-            if new_entries > 0:
-                st.success(f"Added {new_entries} new resolution{'s' if new_entries != 1 else ''}!")
-            else:
-                st.info("No new resolutions found.")
-            
-            # Save the update time
-            save_last_update()
-            
-            # Return the number of new entries
-            return new_entries
-    return 0
+        print(f"Error starting update check: {e}")
+        return False
 
 def get_penalty_count():
     """Get the total number of penalties in the database"""
     try:
-        with sqlite3.connect("ofac_penalties.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM penalties")
-            return cursor.fetchone()[0]
+        cursor = connect_db().cursor()
+        cursor.execute("SELECT COUNT(*) FROM penalties")
+        return cursor.fetchone()[0]
     except Exception as e:
         print(f"Error getting penalty count: {e}")
         return 0
@@ -249,12 +451,11 @@ def get_penalty_count():
 def get_latest_resolution_date():
     """Get the date of the most recent resolution"""
     try:
-        with sqlite3.connect("ofac_penalties.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT MAX(date) FROM penalties")
-            result = cursor.fetchone()
-            if result and result[0]:
-                return datetime.strptime(result[0], '%Y-%m-%d').date()
+        cursor = connect_db().cursor()
+        cursor.execute("SELECT MAX(date) FROM penalties")
+        result = cursor.fetchone()
+        if result and result[0]:
+            return datetime.strptime(result[0], '%Y-%m-%d').date()
     except Exception as e:
         print(f"Error getting latest resolution date: {e}")
     return None
@@ -276,8 +477,8 @@ def main():
     if 'page_number' not in st.session_state:
         st.session_state.page_number = 1
     
-    # Check for updates when the page loads
-    new_entries = check_for_updates()
+    # Check for updates in the background; this page is served from the existing data meanwhile
+    check_for_updates()
     
     # Sidebar for search options
     with st.sidebar:
@@ -311,6 +512,15 @@ def main():
             ]
         )
         
+        # Result order
+        sort_order = st.selectbox(
+            "Sort Results By",
+            [
+                SortOrder.NEWEST,
+                SortOrder.RELEVANCE
+            ]
+        )
+        
         # Add a visual divider
         st.divider()
         
@@ -318,7 +528,8 @@ def main():
         st.header("Get New Resolutions")
         
         # Show last update time and latest resolution
-        last_update = check_last_update()
+        status = get_refresh_status(connect_db())
+        last_update = status['last_success_at']
         latest_date = get_latest_resolution_date()
         
         if last_update and latest_date:
@@ -332,23 +543,26 @@ def main():
                 f"has been added, you can manually perform another search (or reload the page if 24 hours have passed)."
             )
         
+        if status['state'] == 'running':
+            st.info("Checking for new resolutions in the background. Reload the page to see any that are found.")
+        elif status['state'] == 'failed':
+            st.warning(f"The last check for new resolutions failed: {status['error']}")
+        elif status['new_entries']:
+            new_entries = status['new_entries']
+            st.success(f"The last check added {new_entries} new resolution{'s' if new_entries != 1 else ''}!")
+        
         # Manual update button
         if st.button("Check For New Resolutions"):
-            new_entries = check_for_updates(manual_update=True)
-            if new_entries > 0:
-                st.success(f"Added {new_entries} new resolution{'s' if new_entries != 1 else ''}!")
-                save_last_update()
-            else:
-                st.info("No new resolutions found.")
-                save_last_update()
+            check_for_updates(manual_update=True)
+            st.rerun()
 
     # Main search interface
     search_text = st.text_input("Enter search terms")
     
     if search_text:
-        conn = connect_db()
-        results = search_penalties(search_text, search_type, start_date, end_date, conn)
-        total_results = len(results)
+        # Reruns for pagination and excerpts reuse the cached count and pages
+        db_version = get_db_version(connect_db())
+        total_results = cached_count_penalties(search_text, search_type, start_date, end_date, db_version)
         
         # Pagination logic
         results_per_page = 20
@@ -386,14 +600,19 @@ def main():
                             st.session_state.page_number = page
                             st.rerun()
         
-        # Slice results for current page
-        start_idx = (st.session_state.page_number - 1) * results_per_page
-        end_idx = start_idx + results_per_page
-        page_results = results[start_idx:end_idx]
+        # Fetch only the current page, and the PDF pages matching the search
+        page_results = cached_search_penalties(
+            search_text, search_type, start_date, end_date,
+            st.session_state.page_number, results_per_page, sort_order, db_version
+        )
+        pdf_pages = cached_matching_pages(
+            tuple(result[5] for result in page_results), search_text, search_type, db_version
+        )
         
         # Display results for current page
         for result_idx, result in enumerate(page_results):
-            date_str, name, num_penalties, amount, revision_date, pdf_url, pdf_content = result
+            date_str, name, num_penalties, amount, revision_date, pdf_url, page_hits = result
+            pages = pdf_pages.get(pdf_url, [])
             
             # Create a unique key for this result
             result_key = f"{date_str}_{name}_{result_idx}"
@@ -408,21 +627,26 @@ def main():
             
             with st.expander(f"{formatted_date}{revision_info} - {name} - ${amount:,.2f}"):
                 st.write(f"Number of Penalties: {num_penalties}")
+                if page_hits:
+                    st.write(f"Matches on {page_hits} page{'s' if page_hits != 1 else ''} of the PDF")
                 
-                excerpts = find_excerpts(pdf_content, search_text, search_type)
-                if excerpts:
-                    total_excerpts = len(excerpts)
+                windows = cached_page_windows(pdf_url, search_text, search_type, db_version, pages)
+                if windows:
+                    total_excerpts = len(windows)
                     st.write(f"Found {total_excerpts} matching excerpt{'s' if total_excerpts != 1 else ''}")
                     
-                    # Display excerpts up to the current limit
-                    for i, (excerpt, _) in enumerate(excerpts):  # Ignore page_num
-                        if i >= st.session_state.excerpt_limits[result_key]:
-                            break
+                    # Build and display excerpts up to the current limit
+                    page_texts = dict(pages)
+                    for window in windows[:st.session_state.excerpt_limits[result_key]]:
+                        page_no = window[0]
+                        excerpt = format_excerpt(page_texts[page_no], window)
                         
                         # Replace newlines with spaces in the excerpt for the blockquote
                         formatted_excerpt = excerpt.replace('\n', '\n>')
                         
-                        # Display the excerpt without page number
+                        # Page 0 holds text stored before pages were kept apart
+                        if page_no:
+                            st.caption(f"Page {page_no}")
                         st.markdown(f">{formatted_excerpt}")
                         st.markdown("---")  # Add a separator between excerpts
                     
@@ -435,8 +659,6 @@ def main():
                 
                 if pdf_url:
                     st.markdown(f"[View Full PDF]({pdf_url})")
-        
-        conn.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file